@@ -3,17 +3,23 @@ import pandas as pd
 import os
 import shutil
 import zipfile
-from PIL import Image, ExifTags
+from PIL import UnidentifiedImageError
 from datetime import datetime
-import requests
-from geopy.geocoders import Nominatim
+from zoneinfo import ZoneInfo
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 import json
-from io import BytesIO
-import openpyxl
 import warnings
 
+import archive
+import drive_sync
+import exports
+import geo
+import photos
+import reports
+import roster
+import storage
+
 # Suppress oauth2client warnings
 warnings.filterwarnings("ignore", message="Cannot access mycreds.txt*", category=UserWarning)
 
@@ -23,22 +29,31 @@ warnings.filterwarnings("ignore", message="Cannot access mycreds.txt*", category
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Photos waiting for "Submit Attendance"; unsubmitted ones are removed in the background
+STAGING_DIR = "staging"
+photos.start_staging_gc(STAGING_DIR)
+
 USERS_DB = "users_db.csv"
 ATTEND_DB = "attendance_db.csv"
 ADMIN_FILE = "admin_config.json"
 
-# Create databases if not exist
-if not os.path.exists(USERS_DB):
-    pd.DataFrame(columns=["Name","Roll_No","Organisation","Group"]).to_csv(USERS_DB, index=False)
+# Create databases if not exist (CSV files or SQLite, see storage.STORAGE_BACKEND)
+@st.cache_resource
+def open_storage():
+    backend = storage.open_backend(USERS_DB, ATTEND_DB)
+    # Fold delete/edit journals left from the previous run into their tables;
+    # while running they are compacted whenever they grow past JOURNAL_COMPACT_BYTES
+    backend.compact()
+    return backend
 
-if not os.path.exists(ATTEND_DB):
-    pd.DataFrame(columns=[
-        "Group","Name","Roll_No",
-        "Capture_Date","Capture_Time",
-        "Latitude","Longitude",
-        "Photo_Location","Upload_Location",
-        "Image_File"
-    ]).to_csv(ATTEND_DB, index=False)
+db = open_storage()
+
+# Dashboard aggregates, updated on every submit (see reports.Rollups)
+@st.cache_resource
+def open_rollups():
+    return reports.Rollups(reports.ROLLUPS_DB)
+
+rollups = open_rollups()
 
 # Default admin password file
 if not os.path.exists(ADMIN_FILE):
@@ -94,75 +109,24 @@ def authenticate_drive():
         return None
 
 drive = authenticate_drive()
-FOLDER_ID = "1dfGKUkt5aZdStbFtiqweC-3R9994mcWs"
+FOLDER_ID = drive_sync.DRIVE_FOLDER_ID
+
+# Background upload queue: Submit only enqueues, worker threads upload with retries
+@st.cache_resource
+def start_upload_queue():
+    queue = drive_sync.UploadQueue(drive_sync.UPLOAD_QUEUE_DB)
+    client = {"drive": None}
+    drive_sync.start_workers(queue, lambda: client["drive"])
+    return queue, client
+
+upload_queue, upload_client = start_upload_queue()
+if drive is not None:
+    upload_client["drive"] = drive_sync.PyDriveClient(drive, FOLDER_ID)
 
 # ------------------------------------------------
 # HELPER FUNCTIONS
 # ------------------------------------------------
 
-def dms_to_dd(dms):
-    """Convert GPS coordinates from DMS (degrees, minutes, seconds) to DD (decimal degrees)"""
-    try:
-        if isinstance(dms, tuple) and len(dms) == 3:
-            degrees = float(dms[0][0]) / float(dms[0][1]) if isinstance(dms[0], tuple) else float(dms[0])
-            minutes = float(dms[1][0]) / float(dms[1][1]) if isinstance(dms[1], tuple) else float(dms[1])
-            seconds = float(dms[2][0]) / float(dms[2][1]) if isinstance(dms[2], tuple) else float(dms[2])
-            return degrees + (minutes / 60.0) + (seconds / 3600.0)
-        else:
-            # Handle cases where DMS might be stored as simple floats
-            return float(dms)
-    except (TypeError, ValueError, IndexError, ZeroDivisionError):
-        return None
-
-def get_exif_data(img):
-    """Extract EXIF data including GPS coordinates from image"""
-    try:
-        exif_raw = img._getexif()
-        if not exif_raw:
-            return None, None, None
-
-        exif = {ExifTags.TAGS.get(k, k): v for k, v in exif_raw.items()}
-        capture_time = exif.get("DateTimeOriginal", exif.get("DateTime", None))
-
-        gps = exif.get("GPSInfo", None)
-        lat, lon = None, None
-
-        if gps:
-            gps_data = {ExifTags.GPSTAGS.get(k, k): v for k, v in gps.items()}
-
-            # Extract latitude
-            if "GPSLatitude" in gps_data:
-                lat = dms_to_dd(gps_data["GPSLatitude"])
-                if gps_data.get("GPSLatitudeRef") == "S" and lat:
-                    lat = -lat
-
-            # Extract longitude
-            if "GPSLongitude" in gps_data:
-                lon = dms_to_dd(gps_data["GPSLongitude"])
-                if gps_data.get("GPSLongitudeRef") == "W" and lon:
-                    lon = -lon
-
-        return capture_time, lat, lon
-    except Exception as e:
-        print(f"Error extracting EXIF data: {e}")
-        return None, None, None
-
-def reverse_geocode(lat, lon):
-    try:
-        geolocator = Nominatim(user_agent="attendance_app")
-        loc = geolocator.reverse(f"{lat},{lon}", language="en")
-        return loc.address if loc else "Unknown"
-    except:
-        return "Unknown"
-
-def get_upload_location():
-    try:
-        ip = requests.get("https://api64.ipify.org?format=json").json()["ip"]
-        info = requests.get(f"https://ipinfo.io/{ip}/json").json()
-        return f"{info.get('city','Unknown')}, {info.get('region','Unknown')}"
-    except:
-        return "Unknown"
-
 def upload_to_drive(local_path, drive_name):
     global drive
     if drive is None:
@@ -171,14 +135,9 @@ def upload_to_drive(local_path, drive_name):
         if drive is None:
             st.warning("Google Drive not configured. Images will be saved locally only. To enable Drive upload, add 'client_secrets.json' file.")
             return
-    try:
-        file = drive.CreateFile({"title": drive_name, "parents":[{"id":FOLDER_ID}]})
-        file.SetContentFile(local_path)
-        file.Upload()
-        st.success("Image uploaded to Google Drive!")
-    except Exception as e:
-        st.error(f"Failed to upload to Google Drive: {e}")
-        st.info("Image saved locally only.")
+        upload_client["drive"] = drive_sync.PyDriveClient(drive, FOLDER_ID)
+    upload_queue.enqueue(local_path, drive_name)
+    st.info("Image queued for upload to Google Drive.")
 
 def load_admin():
     with open(ADMIN_FILE) as f:
@@ -188,14 +147,6 @@ def save_admin(user,pwd):
     with open(ADMIN_FILE,"w") as f:
         json.dump({"username":user,"password":pwd}, f)
 
-def dataframe_to_excel_bytes(df):
-    """Convert pandas DataFrame to Excel file bytes"""
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Attendance')
-    output.seek(0)
-    return output.getvalue()
-
 # ------------------------------------------------
 # STREAMLIT UI
 # ------------------------------------------------
@@ -217,16 +168,19 @@ if "current_page" not in st.session_state:
 col1, col2, col3 = st.columns([1, 1, 2])  # Left space, center space, right space
 
 with col3:
-    nav_col1, nav_col2 = st.columns(2)
+    nav_col1, nav_col2, nav_col3 = st.columns(3)
     with nav_col1:
         if st.button("📝 Register", key="nav_register", use_container_width=True):
             st.session_state.current_page = "register"
     with nav_col2:
         if st.button("👑 Admin", key="nav_admin", use_container_width=True):
             st.session_state.current_page = "admin"
+    with nav_col3:
+        if st.button("📊 Dashboard", key="nav_dashboard", use_container_width=True):
+            st.session_state.current_page = "dashboard"
 
 # Add back button for register and admin pages
-if st.session_state.current_page in ["register", "admin"]:
+if st.session_state.current_page in ["register", "admin", "dashboard"]:
     if st.button("⬅️ Back to Attendance", key="back_button"):
         st.session_state.current_page = "attendance"
         st.rerun()
@@ -246,11 +200,9 @@ if st.session_state.current_page == "register":
         roll = st.text_input("Roll Number", key="reg_roll")
 
     with col2:
-        orgs = ["BASM4","BASM2","MAPA2","MAPA4","BASM6","BASM3"]
-        org = st.selectbox("Program", orgs, key="reg_org")
+        org = st.selectbox("Program", roster.ORGANISATIONS, key="reg_org")
 
-        users = pd.read_csv(USERS_DB)
-        groups = users["Group"].dropna().unique().tolist()
+        groups = db.groups()
         groups.append("Create New Group")
         group = st.selectbox("Group", groups, key="reg_group")
 
@@ -270,16 +222,14 @@ if st.session_state.current_page == "register":
                 st.error("Please enter a roll number")
             elif group == "Create New Group" and not group_name.strip():
                 st.error("Please enter a new group name")
-            elif users[(users["Name"] == name.strip()) & (users["Roll_No"] == roll.strip())].shape[0] > 0:
-                st.error("User with this name and roll number already exists")
             else:
-                df = pd.read_csv(USERS_DB)
                 final_group = group_name.strip()
-                new = pd.DataFrame([[name.strip(), roll.strip(), org, final_group]], columns=df.columns)
-                df = pd.concat([df, new], ignore_index=True)
-                df.to_csv(USERS_DB, index=False)
-                st.success("Registered Successfully!")
-                st.rerun()
+                error = roster.register_user(db, {"Name": name.strip(), "Roll_No": roll.strip(), "Organisation": org, "Group": final_group})
+                if error:
+                    st.error(error)
+                else:
+                    st.success("Registered Successfully!")
+                    st.rerun()
 
 elif st.session_state.current_page == "admin":
     # ------------------------------------------------
@@ -319,76 +269,243 @@ elif st.session_state.current_page == "admin":
         # ---------- GROUP MANAGEMENT ----------
         st.markdown("### 🔧 Manage Groups")
 
-        users_df = pd.read_csv(USERS_DB)
+        available_groups = db.groups()
 
         # Add new group
         new_group = st.text_input("Add new group", key="new_group_input")
         if st.button("Add Group"):
             if new_group.strip():
-                users_df.loc[len(users_df)] = ["","","",new_group.strip()]
-                users_df.to_csv(USERS_DB, index=False)
+                db.append_user({"Name": "", "Roll_No": "", "Organisation": "", "Group": new_group.strip()})
                 st.success("Group added!")
                 st.rerun()
             else:
                 st.error("Please enter a group name")
 
         # Rename group
-        if not users_df.empty and "Group" in users_df.columns:
-            available_groups = users_df["Group"].dropna().unique().tolist()
-            if available_groups:
-                col1, col2 = st.columns(2)
-                with col1:
-                    old = st.selectbox("Select group to rename", available_groups, key="rename_old")
-                with col2:
-                    new = st.text_input("New group name", key="rename_new")
-
-                if st.button("Rename Group"):
-                    if new.strip() and new.strip() != old:
-                        users_df["Group"] = users_df["Group"].replace(old, new.strip())
-                        users_df.to_csv(USERS_DB, index=False)
-                        st.success("Group renamed!")
-                        st.rerun()
-                    elif new.strip() == old:
-                        st.error("New group name must be different from current name")
-                    else:
-                        st.error("Please enter a new group name")
+        if available_groups:
+            col1, col2 = st.columns(2)
+            with col1:
+                old = st.selectbox("Select group to rename", available_groups, key="rename_old")
+            with col2:
+                new = st.text_input("New group name", key="rename_new")
+
+            if st.button("Rename Group"):
+                if new.strip() and new.strip() != old:
+                    db.rename_group(old, new.strip())
+                    st.success("Group renamed!")
+                    st.rerun()
+                elif new.strip() == old:
+                    st.error("New group name must be different from current name")
+                else:
+                    st.error("Please enter a new group name")
 
         # Delete group
-        if not users_df.empty and "Group" in users_df.columns:
-            available_groups = users_df["Group"].dropna().unique().tolist()
-            if available_groups:
-                delg = st.selectbox("Select group to delete", available_groups, key="delete_group")
-                if st.button("Delete Group"):
-                    # Check if group has users
-                    users_in_group = len(users_df[users_df["Group"] == delg])
-                    if users_in_group > 0:
-                        st.error(f"Cannot delete group '{delg}' - it contains {users_in_group} user(s). Remove users first.")
-                    else:
-                        users_df = users_df[users_df["Group"] != delg]
-                        users_df.to_csv(USERS_DB, index=False)
-                        st.success("Group deleted!")
-                        st.rerun()
+        if available_groups:
+            delg = st.selectbox("Select group to delete", available_groups, key="delete_group")
+            if st.button("Delete Group"):
+                # Check if group has users
+                users_in_group = db.count_in_group(delg)
+                if users_in_group > 0:
+                    st.error(f"Cannot delete group '{delg}' - it contains {users_in_group} user(s). Remove users first.")
+                else:
+                    db.delete_group(delg)
+                    st.success("Group deleted!")
+                    st.rerun()
+
+        # ---------- BULK IMPORT ----------
+        st.markdown("### 📥 Bulk Import Roster")
+        st.caption("CSV or Excel file with columns Name, Roll_No, Organisation (Program) and Group")
+        roster_file = st.file_uploader("Upload roster", type=["csv","xlsx"], key="roster_upload")
+        if roster_file and st.button("Import Roster", key="import_roster"):
+            try:
+                imported, report = roster.import_roster(db, roster.read_roster(roster_file))
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.success(f"Imported {imported} user(s)")
+                if not report.empty:
+                    st.warning(f"{len(report)} row(s) were skipped")
+                    st.dataframe(report, use_container_width=True)
+                    st.download_button(
+                        "Download Error Report",
+                        report.to_csv(index=False),
+                        file_name="roster_import_errors.csv",
+                        mime="text/csv"
+                    )
 
         # ---------- EDIT ATTENDANCE ----------
         st.markdown("### 📊 Edit Attendance Records")
-        att = pd.read_csv(ATTEND_DB)
-        if not att.empty:
-            st.dataframe(att, use_container_width=True)
-
-            # Only show delete option if there are records
-            if len(att) > 0:
-                row_id = st.number_input("Enter row index to delete", min_value=0, max_value=len(att)-1, step=1, key="delete_row_id")
-                if st.button("Delete Row"):
-                    try:
-                        att = att.drop(index=row_id)
-                        att.to_csv(ATTEND_DB, index=False)
-                        st.success("Row deleted!")
+        # Filtering, sorting and paging run on the server; only the visible page is sent
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            grid_group = st.selectbox("Group", ["All groups"] + db.groups(), key="grid_group")
+        with col2:
+            grid_name = st.text_input("Name contains", key="grid_name").strip()
+        with col3:
+            grid_roll = st.text_input("Roll No", key="grid_roll").strip()
+        with col4:
+            grid_dates = st.date_input("Date range", value=(), key="grid_dates")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            grid_sort = st.selectbox("Sort by", storage.SORT_COLUMNS, key="grid_sort")
+        with col2:
+            grid_desc = st.checkbox("Newest / Z-A first", value=True, key="grid_desc")
+        with col3:
+            page_size = st.selectbox("Rows per page", [25, 50, 100], key="grid_page_size")
+
+        grid_filters = {
+            "group": None if grid_group == "All groups" else grid_group,
+            "name": grid_name or None,
+            "roll": grid_roll or None,
+            "start": grid_dates[0] if len(grid_dates) > 0 else None,
+            "end": grid_dates[-1] if len(grid_dates) > 0 else None,
+        }
+        _, total = db.query_attendance(**grid_filters, limit=0)
+        pages = max(1, -(-total // page_size))
+        page_no = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key="grid_page")
+        page, total = db.query_attendance(**grid_filters, sort=grid_sort, descending=grid_desc,
+                                          limit=page_size, offset=(min(page_no, pages) - 1) * page_size)
+
+        if total:
+            st.caption(f"{total} matching record(s)")
+            st.dataframe(page, use_container_width=True, hide_index=True)
+
+            labels = {
+                rid: f"{name} - {date} {time} ({rid[:8]})"
+                for rid, name, date, time in zip(page["Record_Id"], page["Name"], page["Capture_Date"], page["Capture_Time"])
+            }
+            to_delete = st.multiselect("Select records to delete", list(labels), format_func=labels.get,
+                                       key=f"delete_records_{hash(tuple(labels))}")
+            if st.button("Delete Selected Records", disabled=not to_delete):
+                removed = db.delete_attendance(to_delete)
+                if "Image_File" in removed.columns:
+                    photos.release_photos(UPLOAD_DIR, removed["Image_File"],
+                                          archive.attendance_history(db, columns=["Image_File"]))
+                st.success(f"Deleted {len(removed)} record(s)!")
+                st.rerun()
+
+            # Edit one record (on CSV the change is journalled, not a table rewrite)
+            edit_id = st.selectbox("Select record to edit", [None] + list(labels), key=f"edit_record_{hash(tuple(labels))}",
+                                   format_func=lambda rid: "-" if rid is None else labels[rid])
+            if edit_id is not None:
+                current = page[page["Record_Id"] == edit_id].iloc[0]
+                group_options = db.groups()
+                if current["Group"] not in group_options:
+                    group_options.insert(0, current["Group"])
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    edit_group = st.selectbox("Group", group_options, index=group_options.index(current["Group"]),
+                                              key=f"edit_group_{edit_id}")
+                with col2:
+                    edit_date = st.text_input("Capture date (YYYY-MM-DD)", value=str(current["Capture_Date"]),
+                                              key=f"edit_date_{edit_id}")
+                with col3:
+                    edit_time = st.text_input("Capture time (HH:MM:SS)", value=str(current["Capture_Time"]),
+                                              key=f"edit_time_{edit_id}")
+                if st.button("Save Record", key="save_record"):
+                    changes = {col: value for col, value in
+                               (("Group", edit_group), ("Capture_Date", edit_date.strip()), ("Capture_Time", edit_time.strip()))
+                               if value != str(current[col])}
+                    if not changes:
+                        st.info("Nothing changed.")
+                    elif storage.capture_timestamp(edit_date.strip(), edit_time.strip()) is None:
+                        st.error("Enter a valid date and time")
+                    elif db.update_attendance(edit_id, changes):
+                        st.success("Record updated!")
                         st.rerun()
-                    except KeyError:
-                        st.error(f"Row {row_id} does not exist")
+                    else:
+                        st.error("Record no longer exists")
         else:
             st.info("No attendance records found")
 
+        # ---------- BULK EDIT ----------
+        st.markdown("### 🧹 Bulk Edit Attendance")
+        st.caption("Apply one change to every record matching the filters, in a single write.")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            bulk_group = st.selectbox("Group", ["Any group"] + db.groups(), key="bulk_group")
+        with col2:
+            bulk_dates = st.date_input("Date range", value=(), key="bulk_dates")
+        with col3:
+            users_all = db.load_users()
+            interns = {roll: f"{name} ({roll})" for name, roll in zip(users_all["Name"], users_all["Roll_No"])
+                       if isinstance(roll, str)}
+            bulk_roll = st.selectbox("Intern", [None] + list(interns), key="bulk_roll",
+                                     format_func=lambda r: "Any intern" if r is None else interns[r])
+        with col4:
+            bulk_no_gps = st.checkbox("Missing GPS only", key="bulk_no_gps")
+
+        bulk_filters = {
+            "group": None if bulk_group == "Any group" else bulk_group,
+            "start": bulk_dates[0] if len(bulk_dates) > 0 else None,
+            "end": bulk_dates[-1] if len(bulk_dates) > 0 else None,
+            "roll": bulk_roll,
+            "missing_gps": bulk_no_gps,
+        }
+        bulk_action = st.radio("Action", ["Delete", "Reassign group", "Fix date"], horizontal=True, key="bulk_action")
+        bulk_value = None
+        if bulk_action == "Reassign group":
+            bulk_value = st.selectbox("New group", db.groups(), key="bulk_new_group")
+        elif bulk_action == "Fix date":
+            bulk_value = st.date_input("New date", key="bulk_new_date")
+
+        if not storage.has_filters(**bulk_filters):
+            st.info("Choose at least one filter.")
+        else:
+            # Dry run: count what the action would touch before anything is written
+            matched = db.match_attendance(**bulk_filters)
+            st.write(f"**{len(matched)}** record(s) match.")
+            if len(matched):
+                with st.expander("Preview matching records"):
+                    st.dataframe(matched.head(100), use_container_width=True, hide_index=True)
+                # Keyed on the table version so the confirmation resets after every change
+                confirm = st.checkbox(f"Yes, {bulk_action.lower()} {len(matched)} record(s)",
+                                      key=f"bulk_confirm_{hash(repr(db.version('attendance')))}")
+                if st.button("Apply", key="bulk_apply", disabled=not confirm or (bulk_action != "Delete" and not bulk_value)):
+                    if bulk_action == "Delete":
+                        removed = db.delete_matching(**bulk_filters)
+                        if "Image_File" in removed.columns:
+                            photos.release_photos(UPLOAD_DIR, removed["Image_File"],
+                                                  archive.attendance_history(db, columns=["Image_File"]))
+                        st.success(f"Deleted {len(removed)} record(s)")
+                    elif bulk_action == "Reassign group":
+                        st.success(f"Moved {db.update_matching({'Group': bulk_value}, **bulk_filters)} record(s) to {bulk_value}")
+                    else:
+                        st.success(f"Set the date of {db.update_matching({'Capture_Date': str(bulk_value)}, **bulk_filters)} record(s) to {bulk_value}")
+                    st.rerun()
+
+        # ---------- DRIVE UPLOADS ----------
+        st.markdown("### ☁️ Google Drive Uploads")
+        counts = upload_queue.counts()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Pending", counts.get("pending", 0) + counts.get("running", 0))
+        col2.metric("Uploaded", counts.get("done", 0))
+        col3.metric("Failed", counts.get("failed", 0))
+        with col4:
+            if st.button("Retry Failed", key="retry_uploads", disabled=not counts.get("failed")):
+                st.success(f"Re-queued {upload_queue.retry_failed()} upload(s)")
+        if counts:
+            with st.expander("Upload jobs"):
+                st.dataframe(upload_queue.recent(), use_container_width=True)
+
+        # Bring Drive up to date with local uploads (e.g. photos taken while Drive was unavailable)
+        refresh_listing = st.checkbox("Re-list Drive folder", key="sync_refresh")
+        if st.button("Sync Uploads to Drive", key="sync_drive"):
+            if upload_client["drive"] is None:
+                st.warning("Google Drive not configured. To enable Drive upload, add 'client_secrets.json' file.")
+            else:
+                with st.spinner("Syncing uploads with Google Drive..."):
+                    try:
+                        summary = drive_sync.sync_uploads(UPLOAD_DIR, upload_client["drive"], refresh=refresh_listing,
+                                                               titles=drive_sync.photo_titles(db.load_attendance()))
+                    except Exception as e:
+                        st.error(f"Sync failed: {e}")
+                    else:
+                        st.success(f"Uploaded {summary['uploaded']} of {summary['scanned']} local file(s)")
+                        if summary["errors"]:
+                            st.error(f"{len(summary['errors'])} upload(s) failed")
+                            st.json(summary["errors"])
+
         # ---------- CHANGE PASSWORD ----------
         st.markdown("### 🔐 Change Admin Password")
         newpwd = st.text_input("New Password", type="password", key="new_password")
@@ -401,14 +518,20 @@ elif st.session_state.current_page == "admin":
                 st.error("Please enter a password")
 
         # ---------- DOWNLOAD EXCEL ----------
-        if not att.empty:
-            excel_data = dataframe_to_excel_bytes(att)
-            st.download_button(
-                "Download Attendance Excel",
-                excel_data,
-                file_name="attendance.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        # Built on demand and cached per attendance-table version
+        if db.count_attendance() or archive.partitions():
+            excel_path = exports.cached_excel(db)
+            if excel_path is None and st.button("Prepare Attendance Excel", key="prepare_excel"):
+                with st.spinner("Building Excel file..."):
+                    excel_path = exports.attendance_excel(db)
+            if excel_path is not None:
+                with open(excel_path, "rb") as excel_file:
+                    st.download_button(
+                        "Download Attendance Excel",
+                        excel_file,
+                        file_name="attendance.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
 
         # ---------- DATA MANAGEMENT ----------
         st.markdown("### 💾 Data Management")
@@ -427,27 +550,16 @@ elif st.session_state.current_page == "admin":
             confirm_col1, confirm_col2 = st.columns(2)
             with confirm_col1:
                 if st.button("✅ YES, DELETE EVERYTHING", key="confirm_reset", use_container_width=True, type="primary"):
-                    # Delete all CSV files
-                    if os.path.exists(USERS_DB):
-                        os.remove(USERS_DB)
-                    if os.path.exists(ATTEND_DB):
-                        os.remove(ATTEND_DB)
-
                     # Delete uploads directory and contents
                     if os.path.exists(UPLOAD_DIR):
                         import shutil
                         shutil.rmtree(UPLOAD_DIR)
                         os.makedirs(UPLOAD_DIR, exist_ok=True)
+                    shutil.rmtree(STAGING_DIR, ignore_errors=True)
+                    shutil.rmtree(archive.ARCHIVE_DIR, ignore_errors=True)
 
                     # Recreate empty databases
-                    pd.DataFrame(columns=["Name","Roll_No","Organisation","Group"]).to_csv(USERS_DB, index=False)
-                    pd.DataFrame(columns=[
-                        "Group","Name","Roll_No",
-                        "Capture_Date","Capture_Time",
-                        "Latitude","Longitude",
-                        "Photo_Location","Upload_Location",
-                        "Image_File"
-                    ]).to_csv(ATTEND_DB, index=False)
+                    db.reset()
 
                     st.session_state.show_reset_confirm = False
                     st.success("✅ All data has been permanently deleted and databases reset!")
@@ -461,28 +573,32 @@ elif st.session_state.current_page == "admin":
 
         # Remove Registration Data
         st.markdown("#### 👥 Remove Registration Data")
-        users_df = pd.read_csv(USERS_DB)
+        users_df = db.load_users()
         if not users_df.empty:
             st.markdown("**Current Users:**")
             st.dataframe(users_df, use_container_width=True)
 
             # Delete specific user
             if len(users_df) > 0:
-                user_options = [f"{row['Name']} ({row['Roll_No']}) - {row['Group']}" for _, row in users_df.iterrows()]
-                selected_user = st.selectbox("Select user to delete", user_options, key="delete_user_select")
+                user_options = {
+                    uid: f"{name} ({roll}) - {group}"
+                    for uid, name, roll, group in zip(users_df["User_Id"], users_df["Name"], users_df["Roll_No"], users_df["Group"])
+                }
+                selected_user = st.selectbox("Select user to delete", list(user_options), format_func=user_options.get,
+                                             key="delete_user_select")
                 if st.button("Delete Selected User", key="delete_user"):
-                    # Find and delete the user
-                    user_index = user_options.index(selected_user)
-                    users_df = users_df.drop(index=user_index)
-                    users_df.to_csv(USERS_DB, index=False)
-                    st.success("User deleted successfully!")
+                    # Deleted by id, so rows added meanwhile by other sessions are unaffected
+                    if len(db.delete_users([selected_user])):
+                        st.success("User deleted successfully!")
+                    else:
+                        st.error("User no longer exists")
                     st.rerun()
 
             # Clear all users
             st.markdown("---")
             st.warning("This will delete ALL registered users!")
             if st.button("Clear All Users", key="clear_all_users", use_container_width=True, type="secondary"):
-                pd.DataFrame(columns=["Name","Roll_No","Organisation","Group"]).to_csv(USERS_DB, index=False)
+                db.replace_users(pd.DataFrame(columns=storage.USERS_COLUMNS))
                 st.success("All users have been deleted!")
                 st.rerun()
         else:
@@ -490,18 +606,16 @@ elif st.session_state.current_page == "admin":
 
         # Remove Column
         st.markdown("#### 📊 Remove Column")
-        att_df = pd.read_csv(ATTEND_DB)
+        att_df = db.load_attendance()
         if not att_df.empty:
             st.markdown("**Current Attendance Columns:**")
             st.write(list(att_df.columns))
 
-            available_columns = [col for col in att_df.columns if col not in ["Group", "Name", "Roll_No"]]  # Keep essential columns
+            available_columns = [col for col in att_df.columns if col not in ["Record_Id", "Group", "Name", "Roll_No", "Capture_Date", "Capture_Time", "Capture_Ts"]]  # Keep essential columns
             if available_columns:
                 column_to_remove = st.selectbox("Select column to remove", available_columns, key="remove_column_select")
                 if st.button("Remove Column", key="remove_column"):
-                    if column_to_remove in att_df.columns:
-                        att_df = att_df.drop(columns=[column_to_remove])
-                        att_df.to_csv(ATTEND_DB, index=False)
+                    if db.drop_attendance_column(column_to_remove):
                         st.success(f"Column '{column_to_remove}' has been removed!")
                         st.rerun()
                     else:
@@ -519,56 +633,87 @@ elif st.session_state.current_page == "admin":
         col1, col2 = st.columns(2)
 
         with col1:
+            incremental = st.checkbox("Only photos added since the last backup", key="export_incremental")
             if st.button("Export All Data (ZIP)", key="export_all", use_container_width=True):
-                import zipfile
-                import io
-
-                # Create ZIP file in memory
-                zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    # Add CSV files
-                    if os.path.exists(USERS_DB):
-                        zip_file.write(USERS_DB, 'users_db.csv')
-                    if os.path.exists(ATTEND_DB):
-                        zip_file.write(ATTEND_DB, 'attendance_db.csv')
-                    if os.path.exists(ADMIN_FILE):
-                        zip_file.write(ADMIN_FILE, 'admin_config.json')
-
-                    # Add images if they exist
-                    if os.path.exists(UPLOAD_DIR):
-                        for root, dirs, files in os.walk(UPLOAD_DIR):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arcname = os.path.join('uploads', file)
-                                zip_file.write(file_path, arcname)
-
-                zip_buffer.seek(0)
-                st.download_button(
-                    "Download Complete Backup (ZIP)",
-                    zip_buffer.getvalue(),
-                    file_name="attendance_system_backup.zip",
-                    mime="application/zip",
-                    use_container_width=True
-                )
+                # Written to disk in chunks; photos are stored without recompression
+                with st.spinner("Creating backup..."):
+                    st.session_state.backup_path = exports.create_backup(db, UPLOAD_DIR, ADMIN_FILE, incremental=incremental)
+
+            backup_path = st.session_state.get("backup_path")
+            if backup_path and os.path.exists(backup_path):
+                with open(backup_path, "rb") as backup_file:
+                    st.download_button(
+                        "Download Complete Backup (ZIP)",
+                        backup_file,
+                        file_name=os.path.basename(backup_path),
+                        mime="application/zip",
+                        use_container_width=True
+                    )
 
         with col2:
             uploaded_backup = st.file_uploader("Import Backup (ZIP)", type=["zip"], key="import_backup")
             if uploaded_backup and st.button("Import Data", key="import_data", use_container_width=True):
+                os.makedirs(exports.BACKUP_DIR, exist_ok=True)
+                archive_path = os.path.join(exports.BACKUP_DIR, "import.zip.part")
                 try:
-                    import zipfile
-                    with zipfile.ZipFile(uploaded_backup, 'r') as zip_file:
-                        # Extract files
-                        zip_file.extractall('.')
-
-                    st.success("Data imported successfully!")
+                    with open(archive_path, "wb") as f:
+                        shutil.copyfileobj(uploaded_backup, f, 1 << 20)
+                    with st.spinner("Importing backup..."):
+                        summary = exports.import_backup(db, archive_path, UPLOAD_DIR, ADMIN_FILE)
+                    st.success(f"Data imported successfully! {summary['extracted']} photo(s) restored, "
+                               f"{summary['skipped']} already present.")
                     st.rerun()
-                except Exception as e:
+                except (ValueError, OSError, zipfile.BadZipFile) as e:
                     st.error(f"Import failed: {e}")
+                finally:
+                    if os.path.exists(archive_path):
+                        os.remove(archive_path)
+
+        # Offline geocoding places
+        st.markdown("#### 🗺️ Offline Places")
+        gazetteer = geo.load_gazetteer()
+        st.caption(
+            f"Photo locations are resolved from a local list of named sites first "
+            f"({len(gazetteer) if gazetteer else 0} loaded). CSV columns: name, lat, lon."
+        )
+        places_file = st.file_uploader("Upload places CSV", type=["csv"], key="places_upload")
+        if places_file and st.button("Load Places", key="load_places"):
+            try:
+                count = geo.save_places(places_file.getvalue().decode("utf-8-sig"))
+                st.success(f"Loaded {count} place(s)")
+            except (ValueError, UnicodeDecodeError) as e:
+                st.error(f"Invalid places file: {e}")
+
+        # Photo store migration
+        st.markdown("#### 🗂️ Photo Store")
+        st.caption("Move photos saved by older versions (flat uploads/ folder) into the deduplicated photo store.")
+        if st.button("Migrate Legacy Photos", key="migrate_photos"):
+            moved = photos.migrate_flat_uploads(db, UPLOAD_DIR)
+            st.success(f"Moved {moved} photo(s) into the photo store")
+
+        # Archive of old attendance
+        st.markdown("#### 🗄️ Attendance Archive")
+        st.caption("Move old attendance out of the live table into compressed monthly files. "
+                   "Archived records still appear on the Dashboard and in exports.")
+        archive_days = st.number_input("Keep the last N days live", min_value=1, value=archive.ARCHIVE_AFTER_DAYS,
+                                       step=30, key="archive_days")
+        archive_cutoff = archive.cutoff_for(int(archive_days))
+        st.write(f"{len(archive.archivable(db, archive_cutoff))} record(s) captured before {archive_cutoff} can be archived.")
+        if st.button("Archive Old Records", key="archive_run"):
+            try:
+                st.success(f"Archived {archive.archive_attendance(db, archive_cutoff)} record(s)")
+            except RuntimeError as e:
+                st.error(str(e))
+        archived = archive.partitions()
+        if archived:
+            with st.expander(f"Archived months ({sum(archived.values())} records)"):
+                st.dataframe(pd.DataFrame({"Month": list(archived), "Records": list(archived.values())}),
+                             use_container_width=True, hide_index=True)
 
         # Database Statistics
         st.markdown("#### 📈 Database Statistics")
-        users_count = len(pd.read_csv(USERS_DB)) if os.path.exists(USERS_DB) else 0
-        attendance_count = len(pd.read_csv(ATTEND_DB)) if os.path.exists(ATTEND_DB) else 0
+        users_count = db.count_users()
+        attendance_count = db.count_attendance()
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -576,24 +721,104 @@ elif st.session_state.current_page == "admin":
         with col2:
             st.metric("Total Attendance Records", attendance_count)
         with col3:
-            groups_count = len(pd.read_csv(USERS_DB)["Group"].dropna().unique()) if users_count > 0 else 0
+            groups_count = db.count_groups()
             st.metric("Total Groups", groups_count)
 
+elif st.session_state.current_page == "dashboard":
+    # ------------------------------------------------
+    # DASHBOARD
+    # ------------------------------------------------
+    st.header("📊 Dashboard")
+
+    if not st.session_state.get("admin_logged_in", False):
+        st.info("Please log in on the Admin page to view the dashboard.")
+        st.stop()
+
+    # Charts read the pre-aggregated rollups; they are rebuilt only if the
+    # attendance table was changed by something other than a submit
+    rollups.refresh(db)
+    first_day, last_day = rollups.date_range()
+    if first_day is None:
+        st.info("No attendance recorded yet.")
+        st.stop()
+
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        period = st.date_input(
+            "Date range",
+            value=(datetime.fromisoformat(first_day).date(), datetime.fromisoformat(last_day).date()),
+            key="dash_period"
+        )
+    with col2:
+        dash_groups = st.multiselect("Groups", rollups.groups(), key="dash_groups")
+    start, end = (period[0], period[-1]) if isinstance(period, (list, tuple)) and period else (first_day, last_day)
+
+    checkins, interns = rollups.totals(start, end, dash_groups)
+    daily = rollups.daily(start, end, dash_groups)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Check-ins", int(checkins))
+    with col2:
+        st.metric("Interns Present", int(interns))
+    with col3:
+        st.metric("Avg. Attendees / Day", f"{daily['attendees'].mean():.1f}" if len(daily) else "0")
+
+    st.markdown("#### Attendees per Day")
+    st.line_chart(daily.set_index("day")[["attendees", "checkins"]])
+    st.download_button("⬇️ Download Daily Summary (CSV)", daily.to_csv(index=False),
+                       file_name="daily_attendance.csv", mime="text/csv", key="dash_csv")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("#### Check-ins by Group")
+        st.bar_chart(rollups.by_group(start, end, dash_groups).set_index("group"))
+    with col2:
+        st.markdown("#### Check-ins by Programme")
+        st.bar_chart(rollups.by_program(start, end, dash_groups).set_index("program"))
+
+    st.markdown("#### 🏆 Top Attendees")
+    st.dataframe(rollups.top_attendees(start, end, dash_groups), use_container_width=True, hide_index=True)
+
+    st.markdown("#### 🕒 Last Seen")
+    st.dataframe(rollups.last_seen(dash_groups), use_container_width=True, hide_index=True)
+
+    # Only cluster centroids and counts are sent to the browser
+    st.markdown("#### 🗺️ Attendance Map")
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        map_zoom = st.slider("Map detail", min_value=2, max_value=16, value=10, key="dash_map_zoom")
+        clusters = reports.location_clusters(db, map_zoom, start, end, dash_groups)
+        drill = st.selectbox(
+            "Zoom into area", [None] + clusters["cell"].tolist(), key="dash_map_cell",
+            format_func=lambda c: "All locations" if c is None else
+            f"{c} ({int(clusters.loc[clusters['cell'] == c, 'count'].iloc[0])} check-ins)"
+        )
+        if drill is not None:
+            clusters = reports.location_clusters(db, map_zoom + 3, start, end, dash_groups, cell=drill)
+        st.caption(f"{int(clusters['count'].sum())} check-ins with GPS in {len(clusters)} area(s)")
+    with col2:
+        if len(clusters):
+            st.map(clusters, latitude="lat", longitude="lon", size="radius",
+                   zoom=map_zoom + 3 if drill is not None else map_zoom)
+        else:
+            st.info("No GPS locations in the selected period.")
+
 else:  # Default to attendance page
     # ------------------------------------------------
     # ATTENDANCE PAGE
     # ------------------------------------------------
     st.header("📸 Mark Attendance")
 
-    users = pd.read_csv(USERS_DB)
-
     # Check if users database is empty
-    if users.empty:
+    if db.count_users() == 0:
         st.warning("No users registered yet. Please register users first using the Register button above.")
         st.stop()
 
+    # Group -> name -> (Roll_No, Organisation), rebuilt only when the users table changes
+    rosters = roster.roster_index(db)
+
     # Get available groups, filter out NaN values
-    available_groups = users["Group"].dropna().unique().tolist()
+    available_groups = list(rosters)
     if not available_groups:
         st.warning("No groups found. Please register users with groups first.")
         st.stop()
@@ -606,12 +831,11 @@ else:  # Default to attendance page
 
     with col2:
         # Get names for selected group
-        group_users = users[users["Group"] == sel_group]
-        if group_users.empty:
+        if sel_group not in rosters:
             st.warning(f"No users found in group '{sel_group}'. Please register users for this group.")
             st.stop()
 
-        available_names = group_users["Name"].dropna().unique().tolist()
+        available_names = list(rosters[sel_group])
         if not available_names:
             st.warning(f"No valid names found in group '{sel_group}'. Please check user registrations.")
             st.stop()
@@ -619,8 +843,8 @@ else:  # Default to attendance page
         sel_name = st.selectbox("Select Name", available_names, key="attendance_name")
 
     # Verify the selected user still exists (in case of concurrent modifications)
-    selected_user = users[(users["Group"] == sel_group) & (users["Name"] == sel_name)]
-    if selected_user.empty:
+    selected_user = rosters.get(sel_group, {}).get(sel_name)
+    if selected_user is None:
         st.error(f"Selected user '{sel_name}' in group '{sel_group}' not found. Please refresh and try again.")
         st.stop()
 
@@ -632,42 +856,48 @@ else:  # Default to attendance page
     )
 
     if uploaded:
-        img = Image.open(uploaded)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # Get roll number safely
+        # Keep the original bytes; only the EXIF header is parsed, pixels are never decoded
+        data = uploaded.getvalue()
         try:
-            roll_no = selected_user["Roll_No"].iloc[0]
-        except (IndexError, KeyError):
-            st.error("Error retrieving user information. Please try again.")
+            ext, cap_time, lat, lon = photos.inspect_photo(data)
+        except (UnidentifiedImageError, ValueError) as e:
+            st.error(f"Could not read image: {e}")
             st.stop()
+        staged_path = photos.stage_photo(data, STAGING_DIR, ext)
 
-        filename = f"{sel_name}_{roll_no}_{ts}.jpg"
-        local_path = os.path.join(UPLOAD_DIR, filename)
-        img.save(local_path)
-
-        cap_time, lat, lon = get_exif_data(img)
+        roll_no, org = selected_user
 
         if cap_time:
             cap_date = cap_time.split(" ")[0].replace(":","-")
             cap_clock = cap_time.split(" ")[1]
         else:
-            cap_date = datetime.now().date()
-            cap_clock = datetime.now().time()
-
-        photo_loc = reverse_geocode(lat, lon) if lat and lon else "Unknown"
-        upload_loc = get_upload_location()
+            now = datetime.now(ZoneInfo(storage.APP_TIMEZONE))
+            cap_date = now.date()
+            cap_clock = now.time().replace(tzinfo=None)
+
+        # Location lookups run concurrently within a latency budget; the upload
+        # location is looked up once per session
+        if "upload_location_job" not in st.session_state:
+            st.session_state.upload_location_job = geo.submit(geo.get_upload_location)
+        enrichment = st.session_state.get("enrichment")
+        if enrichment is None or enrichment[0] != staged_path:
+            enrichment = (staged_path, geo.start_enrichment(lat, lon, st.session_state.upload_location_job))
+            st.session_state.enrichment = enrichment
+        locations = geo.collect(enrichment[1])
+        photo_loc, upload_loc = locations["photo"], locations["upload"]
 
         # Mobile-friendly image display
         col1, col2 = st.columns([1, 2])
         with col1:
             # Smaller image for mobile
             img_width = 200 if st.session_state.get("is_mobile", False) else 300
-            st.image(img, width=img_width, caption="Uploaded Image")
+            st.image(data, width=img_width, caption="Uploaded Image")
 
         with col2:
             st.write("📍 **Photo Location:**", photo_loc)
             st.write("📡 **Upload Location:**", upload_loc)
+            if geo.PENDING in (photo_loc, upload_loc):
+                st.caption("⏳ Location lookup still running - it will be filled in on the next refresh, or saved to the record once it finishes.")
             if lat and lon:
                 st.write(f"📌 **Coordinates:** {lat:.6f}, {lon:.6f}")
             else:
@@ -677,18 +907,28 @@ else:  # Default to attendance page
         col1, col2, col3 = st.columns([1, 1, 1])
         with col2:
             if st.button("Submit Attendance", use_container_width=True):
-                upload_to_drive(local_path, filename)
-
-                df = pd.read_csv(ATTEND_DB)
-                new_row = pd.DataFrame([[
-                    sel_group, sel_name, roll_no,
-                    cap_date, cap_clock,
-                    lat, lon,
-                    photo_loc, upload_loc,
-                    filename
-                ]], columns=df.columns)
-
-                df = pd.concat([df,new_row], ignore_index=True)
-                df.to_csv(ATTEND_DB, index=False)
-                st.success("Attendance Recorded & Image Uploaded!")
+                # Give lookups that are still pending one more budget before recording;
+                # any still running are saved as "Unknown" and written back when they finish
+                pending = []
+                if geo.PENDING in (photo_loc, upload_loc):
+                    locations = geo.collect(enrichment[1])
+                    pending = [name for name, place in locations.items() if place == geo.PENDING]
+                    photo_loc, upload_loc = (
+                        "Unknown" if v == geo.PENDING else v for v in (locations["photo"], locations["upload"])
+                    )
+                image_file = photos.commit_photo(data, staged_path, UPLOAD_DIR)
+                local_path = os.path.join(UPLOAD_DIR, image_file)
+
+                row = {
+                    "Group": sel_group, "Name": sel_name, "Roll_No": roll_no,
+                    "Capture_Date": cap_date, "Capture_Time": cap_clock,
+                    "Latitude": lat, "Longitude": lon,
+                    "Photo_Location": photo_loc, "Upload_Location": upload_loc,
+                    "Image_File": image_file
+                }
+                record_id = rollups.record(db, row, org)
+                geo.backfill(enrichment[1], pending, lambda values: rollups.update(db, record_id, values))
+                st.success("Attendance Recorded!")
+
+                upload_to_drive(local_path, drive_sync.drive_title(row))
 
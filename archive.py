@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+import storage
+
+# ------------------------------------------------
+# HISTORICAL ATTENDANCE ARCHIVE
+# ------------------------------------------------
+# Attendance older than the cutoff is moved out of the hot table into
+# Parquet files partitioned by capture month:
+#   archive/month=2024-01/part-<id>.parquet
+# ARCHIVE_MANIFEST lists the part files and row counts of every month, so a
+# date-range read opens only the partitions it overlaps. Part files are
+# written before the rows leave the hot table; a row found in both places
+# (an interrupted run) is read from the hot table.
+
+ARCHIVE_DIR = os.getenv("ATTENDANCE_ARCHIVE_DIR", "archive")
+ARCHIVE_MANIFEST = "manifest.json"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+COMPRESSION = "zstd"
+
+_lock = threading.Lock()
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise RuntimeError("The attendance archive needs pyarrow (pip install pyarrow)") from None
+
+def _manifest_path(archive_dir):
+    return os.path.join(archive_dir, ARCHIVE_MANIFEST)
+
+def load_manifest(archive_dir=ARCHIVE_DIR):
+    try:
+        with open(_manifest_path(archive_dir)) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    manifest.setdefault("partitions", {})
+    return manifest
+
+def _save_manifest(manifest, archive_dir):
+    path = _manifest_path(archive_dir)
+    tmp = f"{path}.part"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def version(archive_dir=ARCHIVE_DIR):
+    """Changes whenever partitions are added or rewritten"""
+    return storage.file_signature(_manifest_path(archive_dir))
+
+def partitions(archive_dir=ARCHIVE_DIR):
+    """month -> archived row count"""
+    return {month: entry["rows"] for month, entry in sorted(load_manifest(archive_dir)["partitions"].items())}
+
+def cutoff_for(days=ARCHIVE_AFTER_DAYS):
+    """First local day kept in the hot table"""
+    return (datetime.now(ZoneInfo(storage.APP_TIMEZONE)) - timedelta(days=days)).date()
+
+def _months(ts):
+    local = pd.to_datetime(ts.astype("int64"), unit="s", utc=True).dt.tz_convert(storage.APP_TIMEZONE)
+    return local.dt.strftime("%Y-%m")
+
+def archivable(db, cutoff):
+    """Hot rows captured before the local day `cutoff`"""
+    return db.attendance_between(None, cutoff - timedelta(days=1))
+
+def archive_attendance(db, cutoff, archive_dir=ARCHIVE_DIR):
+    """Move attendance captured before `cutoff` into the archive; returns rows moved"""
+    _require_pyarrow()
+    with _lock:
+        old = archivable(db, cutoff)
+        if old.empty:
+            return 0
+        os.makedirs(archive_dir, exist_ok=True)
+        manifest = load_manifest(archive_dir)
+        for month, rows in old.groupby(_months(old["Capture_Ts"]), sort=True):
+            folder = os.path.join(archive_dir, f"month={month}")
+            os.makedirs(folder, exist_ok=True)
+            name = f"part-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+            tmp = os.path.join(folder, f"{name}.part")
+            rows.to_parquet(tmp, engine="pyarrow", compression=COMPRESSION, index=False)
+            os.replace(tmp, os.path.join(folder, name))
+            entry = manifest["partitions"].setdefault(month, {"files": [], "rows": 0})
+            entry["files"].append(f"month={month}/{name}")
+            entry["rows"] += len(rows)
+        _save_manifest(manifest, archive_dir)
+        db.delete_attendance(old[storage.RECORD_ID])
+        return len(old)
+
+def remap_archive(column, mapping, archive_dir=ARCHIVE_DIR):
+    """Replace values of one column ({old: new}) in every part file; returns the rows changed"""
+    manifest = load_manifest(archive_dir)
+    files = [relpath for entry in manifest["partitions"].values() for relpath in entry["files"]]
+    if not files or not mapping:
+        return 0
+    _require_pyarrow()
+    changed = 0
+    with _lock:
+        for relpath in files:
+            path = os.path.join(archive_dir, *relpath.split("/"))
+            rows = pd.read_parquet(path, engine="pyarrow")
+            if column not in rows.columns:
+                continue
+            values = rows[column].astype(object)
+            hit = values.isin(list(mapping))
+            if not hit.any():
+                continue
+            rows[column] = values.where(~hit, values.map(mapping))
+            tmp = f"{path}.part"
+            rows.to_parquet(tmp, engine="pyarrow", compression=COMPRESSION, index=False)
+            os.replace(tmp, path)
+            changed += int(hit.sum())
+        if changed:
+            _save_manifest(manifest, archive_dir)  # new version() for caches keyed on it
+    return changed
+
+def read_archive(start=None, end=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """Archived attendance for local days start..end, reading only overlapping partitions"""
+    manifest = load_manifest(archive_dir)
+    first = None if start is None else str(start)[:7]
+    last = None if end is None else str(end)[:7]
+    files = [
+        os.path.join(archive_dir, *relpath.split("/"))
+        for month, entry in sorted(manifest["partitions"].items())
+        if (first is None or month >= first) and (last is None or month <= last)
+        for relpath in entry["files"]
+    ]
+    if not files:
+        return None
+    _require_pyarrow()
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + [storage.RECORD_ID, "Capture_Ts"]))
+    frames = [pd.read_parquet(path, engine="pyarrow", columns=columns) for path in files]
+    # Categories differ between files; concatenate as plain values
+    df = pd.concat([f.astype({c: object for c in f.columns if isinstance(f[c].dtype, pd.CategoricalDtype)})
+                    for f in frames], ignore_index=True)
+    if start is not None or end is not None:
+        lo, hi = storage.day_bounds(start, end)
+        ts = df["Capture_Ts"]
+        mask = pd.Series(True, index=df.index)
+        if lo is not None:
+            mask &= ts >= lo
+        if hi is not None:
+            mask &= ts < hi
+        df = df[mask.fillna(False)]
+    return df
+
+def attendance_history(db, start=None, end=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """Hot and archived attendance for local days start..end as one frame"""
+    hot = db.attendance_between(start, end)
+    if columns is not None:
+        hot = hot[[c for c in hot.columns if c in columns or c in (storage.RECORD_ID, "Capture_Ts")]]
+    old = read_archive(start, end, columns, archive_dir)
+    if old is None or old.empty:
+        return hot
+    old = old[~old[storage.RECORD_ID].isin(hot[storage.RECORD_ID])]
+    plain = hot.astype({c: object for c in hot.columns if isinstance(hot[c].dtype, pd.CategoricalDtype)})
+    return storage.compact_attendance(pd.concat([old, plain], ignore_index=True))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Attendance archive utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="move old attendance into the Parquet archive")
+    run.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="keep this many recent days hot")
+    run.add_argument("--users", default="users_db.csv")
+    run.add_argument("--attendance", default="attendance_db.csv")
+    sub.add_parser("list", help="show archived months")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        db = storage.open_backend(args.users, args.attendance)
+        cutoff = cutoff_for(args.days)
+        print(f"Archived {archive_attendance(db, cutoff)} record(s) captured before {cutoff}")
+    elif args.command == "list":
+        for month, rows in partitions().items():
+            print(f"{month}: {rows} record(s)")
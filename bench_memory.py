@@ -0,0 +1,55 @@
+"""Memory benchmark: attendance table as read from CSV vs. the compact cached frame.
+
+Usage: python bench_memory.py [rows ...]
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+SIZES = [100_000, 1_000_000]
+GROUPS = 30
+INTERNS = 600
+PLACES = 80
+
+def make_table(path, rows):
+    rng = np.random.default_rng(0)
+    intern = rng.integers(0, INTERNS, rows)
+    day = rng.integers(0, 120, rows)
+    seconds = rng.integers(8 * 3600, 18 * 3600, rows)
+    dates = (pd.Timestamp("2024-01-01") + pd.to_timedelta(day, unit="D")).strftime("%Y-%m-%d")
+    times = pd.to_timedelta(seconds, unit="s").astype(str).str[-8:]
+    df = pd.DataFrame({
+        "Group": [f"Group {i % GROUPS}" for i in intern],
+        "Name": [f"Intern {i}" for i in intern],
+        "Roll_No": [f"R{i:04d}" for i in intern],
+        "Capture_Date": dates, "Capture_Time": times,
+        "Latitude": 23.15 + rng.normal(0, 0.05, rows), "Longitude": 72.68 + rng.normal(0, 0.05, rows),
+        "Photo_Location": [f"Place {i % PLACES}, Gandhinagar, Gujarat" for i in rng.integers(0, PLACES, rows)],
+        "Upload_Location": "Gandhinagar, Gujarat, IN",
+        "Image_File": [f"{i:064x}.jpg" for i in range(rows)],
+    })
+    storage.normalize_attendance(df).to_csv(path, index=False)
+
+def megabytes(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"{'rows':>10} {'plain MB':>10} {'compact MB':>11} {'per 100k':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, f"attendance_{rows}.csv")
+            make_table(path, rows)
+            plain = storage.read_table(path)
+            compact = storage.compact_attendance(storage.read_table(path))
+            before, after = megabytes(plain), megabytes(compact)
+            scale = 100_000 / rows
+            print(f"{rows:>10} {before:>10.1f} {after:>11.1f} {before * scale:>7.1f} -> {after * scale:>5.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Submit-latency benchmark: read-concat-rewrite vs. append-only writer.
+
+Usage: python bench_submit.py [rows ...]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import storage
+
+SIZES = [1_000, 100_000, 1_000_000]
+
+def make_table(path, rows):
+    df = pd.DataFrame({
+        "Group": "G1", "Name": "Intern", "Roll_No": "R001",
+        "Capture_Date": "2024-01-01", "Capture_Time": "09:00:00",
+        "Latitude": 23.1, "Longitude": 72.6,
+        "Photo_Location": "Campus", "Upload_Location": "Gandhinagar, Gujarat",
+        "Image_File": "Intern_R001_20240101_090000.jpg",
+    }, index=range(rows))
+    df.to_csv(path, index=False)
+
+def sample_row():
+    return {
+        "Group": "G1", "Name": "Intern", "Roll_No": "R001",
+        "Capture_Date": "2024-01-02", "Capture_Time": "09:00:00",
+        "Latitude": 23.1, "Longitude": 72.6,
+        "Photo_Location": "Campus", "Upload_Location": "Gandhinagar, Gujarat",
+        "Image_File": "Intern_R001_20240102_090000.jpg",
+    }
+
+def legacy_submit(path):
+    df = pd.read_csv(path)
+    new_row = pd.DataFrame([list(sample_row().values())], columns=df.columns)
+    df = pd.concat([df, new_row], ignore_index=True)
+    df.to_csv(path, index=False)
+
+def append_submit(path):
+    storage.append_row(path, storage.ATTEND_COLUMNS, sample_row())
+
+def measure(fn, path, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(path)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return p50, p99
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or SIZES
+    print(f"fsync policy: {storage.FSYNC_POLICY}")
+    print(f"{'rows':>10} {'writer':>8} {'p50 ms':>10} {'p99 ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = os.path.join(tmp, f"attendance_{rows}.csv")
+            for name, fn, iterations in (
+                ("legacy", legacy_submit, max(3, min(100, 1_000_000 // rows))),
+                ("append", append_submit, 1000),
+            ):
+                make_table(path, rows)
+                storage.invalidate(path)
+                p50, p99 = measure(fn, path, iterations)
+                print(f"{rows:>10} {name:>8} {p50:>10.3f} {p99:>10.3f}")
+
+if __name__ == "__main__":
+    main()
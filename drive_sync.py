@@ -0,0 +1,374 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+# ------------------------------------------------
+# GOOGLE DRIVE UPLOAD QUEUE
+# ------------------------------------------------
+# Submit only records a job; worker threads upload in the background and
+# retry failures with exponential backoff. Jobs survive restarts because the
+# queue lives in a SQLite file. Every finished upload is recorded in the sync
+# manifest (see sync_uploads) so a later sync knows Drive already has it.
+
+DRIVE_FOLDER_ID = os.getenv("DRIVE_FOLDER_ID", "1dfGKUkt5aZdStbFtiqweC-3R9994mcWs")
+UPLOAD_QUEUE_DB = os.getenv("UPLOAD_QUEUE_DB", "upload_queue.sqlite")
+SYNC_MANIFEST = os.getenv("DRIVE_SYNC_MANIFEST", "drive_manifest.json")
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 3600.0
+POLL_INTERVAL = 2.0
+WORKERS = 2
+
+
+def drive_title(row):
+    """Drive file title of an attendance photo: <Name>_<Roll_No>_<YYYYMMDD>_<HHMMSS><ext>.
+
+    Built from the record's capture date and time, so the upload queue and
+    sync_uploads name the same photo the same way.
+    """
+    def text(col):
+        value = row.get(col)
+        return "" if value is None or pd.isna(value) else str(value)
+
+    stamp = [text("Capture_Date").replace("-", ""), text("Capture_Time").replace(":", "")]
+    ext = os.path.splitext(text("Image_File"))[1] or ".jpg"
+    return "_".join(part for part in [text("Name"), text("Roll_No"), *stamp] if part) + ext
+
+def photo_titles(att):
+    """{Image_File: Drive title} for every photo referenced by the attendance table"""
+    if "Image_File" not in att.columns:
+        return {}
+    rows = att.astype(object).to_dict("records")
+    return {row["Image_File"]: drive_title(row) for row in reversed(rows) if isinstance(row["Image_File"], str)}
+
+
+class PyDriveClient:
+    """Adapter exposing pydrive2's GoogleDrive as upload(local_path, title) -> file id
+    and list_files() -> [{"title", "md5Checksum", "fileSize"}].
+
+    Any object with the same methods (e.g. a fake in tests) can be used as a
+    Drive client instead. httplib2 is not thread-safe, so every thread gets
+    its own authorized HTTP object.
+    """
+
+    def __init__(self, drive, folder_id):
+        self.drive = drive
+        self.folder_id = folder_id
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self.drive.auth.Get_Http_Object()
+            self._local.http = http
+        return http
+
+    def upload(self, local_path, title):
+        file = self.drive.CreateFile({"title": title, "parents": [{"id": self.folder_id}]})
+        file.SetContentFile(local_path)
+        file.Upload(param={"http": self._http()})
+        return file.get("id")
+
+    def list_files(self):
+        query = {"q": f"'{self.folder_id}' in parents and trashed=false"}
+        return [
+            {"title": f.get("title"), "md5Checksum": f.get("md5Checksum"), "fileSize": f.get("fileSize")}
+            for f in self.drive.ListFile(query).GetList()
+        ]
+
+
+class UploadQueue:
+    """Persistent queue of files waiting to be uploaded to Drive"""
+
+    def __init__(self, path=UPLOAD_QUEUE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._con:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, local_path TEXT, title TEXT, "
+                "status TEXT, attempts INTEGER DEFAULT 0, next_attempt REAL, "
+                "last_error TEXT, drive_id TEXT, created REAL, updated REAL)"
+            )
+            self._con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, next_attempt)")
+            # Jobs that were running when the process stopped are picked up again
+            self._con.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+
+    def enqueue(self, local_path, title):
+        now = time.time()
+        with self._lock, self._con:
+            cur = self._con.execute(
+                "INSERT INTO jobs (local_path, title, status, next_attempt, created, updated) "
+                "VALUES (?, ?, 'pending', ?, ?, ?)", (local_path, title, now, now, now)
+            )
+        self._wakeup.set()
+        return cur.lastrowid
+
+    def claim(self):
+        """Mark the next due job as running and return (id, local_path, title), or None"""
+        now = time.time()
+        with self._lock, self._con:
+            row = self._con.execute(
+                "SELECT id, local_path, title FROM jobs WHERE status = 'pending' AND next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT 1", (now,)
+            ).fetchone()
+            if row is not None:
+                self._con.execute("UPDATE jobs SET status = 'running', updated = ? WHERE id = ?", (now, row[0]))
+        return row
+
+    def complete(self, job_id, drive_id=None):
+        with self._lock, self._con:
+            self._con.execute(
+                "UPDATE jobs SET status = 'done', drive_id = ?, last_error = NULL, updated = ? WHERE id = ?",
+                (drive_id, time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        """Record a failed attempt; the job is retried with backoff until MAX_ATTEMPTS"""
+        now = time.time()
+        with self._lock, self._con:
+            attempts = self._con.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] + 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            status = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+            self._con.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, updated = ? WHERE id = ?",
+                (status, attempts, now + delay, str(error), now, job_id)
+            )
+
+    def retry_failed(self):
+        """Put failed jobs back in the queue; returns how many"""
+        now = time.time()
+        with self._lock, self._con:
+            cur = self._con.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, next_attempt = ?, updated = ? "
+                "WHERE status = 'failed'", (now, now)
+            )
+        self._wakeup.set()
+        return cur.rowcount
+
+    def counts(self):
+        with self._lock:
+            rows = self._con.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def recent(self, limit=100):
+        """Latest jobs for the admin panel"""
+        with self._lock:
+            df = pd.read_sql_query(
+                "SELECT id, title, status, attempts, last_error, updated FROM jobs ORDER BY id DESC LIMIT ?",
+                self._con, params=(limit,)
+            )
+        df["updated"] = pd.to_datetime(df["updated"], unit="s")
+        return df
+
+    def wait(self, timeout):
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+
+def run_job(queue, client, job, manifest_path=SYNC_MANIFEST):
+    job_id, local_path, title = job
+    if client is None:
+        queue.fail(job_id, "Google Drive not configured")
+        return
+    try:
+        drive_id = client.upload(local_path, title)
+    except Exception as e:
+        queue.fail(job_id, e)
+        return
+    # Recorded before the job is marked done, so a finished job is always in the manifest
+    try:
+        record_remote([_md5(local_path)], manifest_path)
+    except OSError:
+        pass  # the next sync re-lists Drive instead
+    queue.complete(job_id, drive_id)
+
+def start_workers(queue, client_factory, workers=WORKERS, manifest_path=SYNC_MANIFEST):
+    """Drain `queue` on daemon threads; client_factory() returns a Drive client or None"""
+    def run():
+        while True:
+            job = queue.claim()
+            if job is None:
+                queue.wait(POLL_INTERVAL)
+                continue
+            try:
+                client = client_factory()
+            except Exception as e:
+                queue.fail(job[0], e)
+                continue
+            run_job(queue, client, job, manifest_path)
+
+    threads = [threading.Thread(target=run, name=f"drive-upload-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+# ------------------------------------------------
+# INCREMENTAL UPLOADS SYNC
+# ------------------------------------------------
+# The manifest remembers size, mtime and MD5 of every local photo plus the
+# MD5s known to be in the Drive folder, so a sync only hashes files that
+# changed since the last run and only uploads content Drive does not have.
+# Queue workers add what they upload, so the folder is only listed when a
+# local file is missing from the cached listing.
+
+SYNC_WORKERS = 4
+
+_manifest_lock = threading.Lock()
+
+def load_manifest(path=SYNC_MANIFEST):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    manifest.setdefault("local", {})
+    manifest.setdefault("remote", [])
+    return manifest
+
+def save_manifest(manifest, path=SYNC_MANIFEST):
+    tmp = f"{path}.part"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+def record_remote(md5s, manifest_path=SYNC_MANIFEST):
+    """Add uploaded MD5s to the manifest's Drive listing"""
+    with _manifest_lock:
+        manifest = load_manifest(manifest_path)
+        remote = set(manifest["remote"])
+        if not remote.issuperset(md5s):
+            manifest["remote"] = sorted(remote.union(md5s))
+            save_manifest(manifest, manifest_path)
+
+def _md5(path):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def scan_uploads(upload_dir, manifest):
+    """Refresh manifest["local"]; only new or modified files are hashed. Returns how many were."""
+    previous = manifest["local"]
+    current, hashed = {}, 0
+    for root, _, files in os.walk(upload_dir):
+        for name in files:
+            if name.endswith(".part"):
+                continue
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, upload_dir).replace(os.sep, "/")
+            st = os.stat(path)
+            entry = previous.get(relpath)
+            if entry is None or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+                entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "md5": _md5(path)}
+                hashed += 1
+            current[relpath] = entry
+    manifest["local"] = current
+    return hashed
+
+def refresh_remote(manifest, client):
+    """Replace the cached Drive listing with a fresh one"""
+    manifest["remote"] = sorted({f["md5Checksum"] for f in client.list_files() if f.get("md5Checksum")})
+    manifest["remote_refreshed"] = time.time()
+
+def missing_files(manifest):
+    """Local files whose content is not in the cached Drive listing (one per MD5)"""
+    remote = set(manifest["remote"])
+    missing = {}
+    for relpath, entry in sorted(manifest["local"].items()):
+        if entry["md5"] not in remote:
+            missing.setdefault(entry["md5"], relpath)
+    return sorted(missing.values())
+
+def sync_uploads(upload_dir, client, manifest_path=SYNC_MANIFEST, workers=SYNC_WORKERS, refresh=False,
+                 titles=None):
+    """Upload local photos that are missing from Drive, concurrently.
+
+    The Drive folder is listed only when forced or when the cached listing
+    appears to miss something. `titles` maps upload-relative paths to Drive
+    titles (see photo_titles); other files keep their own name. Returns a
+    summary dict.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    titles = titles or {}
+    manifest = load_manifest(manifest_path)
+    known = set(manifest["remote"])
+    hashed = scan_uploads(upload_dir, manifest)
+    todo = missing_files(manifest)
+    if refresh or todo:
+        refresh_remote(manifest, client)
+        todo = missing_files(manifest)
+
+    def upload(relpath):
+        try:
+            client.upload(os.path.join(upload_dir, *relpath.split("/")), titles.get(relpath, os.path.basename(relpath)))
+            return relpath, None
+        except Exception as e:
+            return relpath, str(e)
+
+    uploaded, errors = [], {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for relpath, error in pool.map(upload, todo):
+            if error:
+                errors[relpath] = error
+            else:
+                uploaded.append(relpath)
+
+    remote = set(manifest["remote"])
+    remote.update(manifest["local"][relpath]["md5"] for relpath in uploaded)
+    with _manifest_lock:
+        # Keep what the queue workers recorded while this sync ran
+        remote.update(set(load_manifest(manifest_path)["remote"]) - known)
+        manifest["remote"] = sorted(remote)
+        save_manifest(manifest, manifest_path)
+    return {"scanned": len(manifest["local"]), "hashed": hashed, "uploaded": len(uploaded), "errors": errors}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Google Drive utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sync = sub.add_parser("sync", help="upload photos missing from the Drive folder")
+    sync.add_argument("--uploads", default="uploads")
+    sync.add_argument("--folder", default=DRIVE_FOLDER_ID)
+    sync.add_argument("--manifest", default=SYNC_MANIFEST)
+    sync.add_argument("--refresh", action="store_true", help="re-list the Drive folder first")
+    sync.add_argument("--users", default="users_db.csv")
+    sync.add_argument("--attendance", default="attendance_db.csv")
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        from pydrive2.auth import GoogleAuth
+        from pydrive2.drive import GoogleDrive
+
+        import storage
+
+        gauth = GoogleAuth()
+        gauth.LoadCredentialsFile("mycreds.txt")
+        if gauth.credentials is None:
+            gauth.LocalWebserverAuth()
+            gauth.SaveCredentialsFile("mycreds.txt")
+        elif gauth.access_token_expired:
+            gauth.Refresh()
+        else:
+            gauth.Authorize()
+
+        client = PyDriveClient(GoogleDrive(gauth), args.folder)
+        titles = photo_titles(storage.open_backend(args.users, args.attendance).load_attendance())
+        summary = sync_uploads(args.uploads, client, args.manifest, refresh=args.refresh, titles=titles)
+        print(f"Scanned {summary['scanned']} file(s), hashed {summary['hashed']}, uploaded {summary['uploaded']}")
+        for relpath, error in summary["errors"].items():
+            print(f"  failed {relpath}: {error}")
@@ -0,0 +1,317 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import archive
+import storage
+
+# ------------------------------------------------
+# EXCEL EXPORT
+# ------------------------------------------------
+# The attendance workbook is written with openpyxl's write-only mode (rows
+# are streamed to disk instead of kept as cell objects) and cached on disk
+# per attendance-table and archive version, so it is only built when the
+# data changed and somebody asked for it. It covers archived records too.
+
+EXPORT_DIR = "exports"
+
+def _cell(value):
+    if pd.api.types.is_scalar(value) and pd.isna(value):  # None, NaN, NaT, pd.NA
+        return None
+    if hasattr(value, "item"):  # numpy scalars
+        value = value.item()
+    return value
+
+def write_excel(df, path, sheet_name="Attendance"):
+    """Stream a DataFrame into an .xlsx file using bounded memory"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append([str(c) for c in df.columns])
+    # itertuples widens float32 to the binary float64 value; go through the
+    # shortest decimal instead (23.1, not 23.100000381)
+    df = df.assign(**{c: df[c].to_numpy().astype(str).astype("float64")
+                      for c in df.columns if df[c].dtype == np.float32})
+    for row in df.itertuples(index=False, name=None):
+        ws.append([_cell(v) for v in row])
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    wb.save(tmp)
+    os.replace(tmp, path)
+
+def _export_path(db, export_dir, table):
+    version = hashlib.sha1(repr((db.version(table), archive.version())).encode()).hexdigest()[:16]
+    return os.path.join(export_dir, f"{table}_{version}.xlsx")
+
+def cached_excel(db, export_dir=EXPORT_DIR):
+    """Path of the attendance workbook for the current table version, if already built"""
+    path = _export_path(db, export_dir, "attendance")
+    return path if os.path.exists(path) else None
+
+def attendance_excel(db, export_dir=EXPORT_DIR):
+    """Build (or reuse) the attendance workbook for the current table version"""
+    os.makedirs(export_dir, exist_ok=True)
+    path = _export_path(db, export_dir, "attendance")
+    if not os.path.exists(path):
+        write_excel(archive.attendance_history(db), path)
+        # Workbooks of older versions are no longer needed
+        for entry in os.scandir(export_dir):
+            if entry.name.startswith("attendance_") and entry.name.endswith(".xlsx") and entry.path != path:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+    return path
+
+# ------------------------------------------------
+# ZIP BACKUPS
+# ------------------------------------------------
+# Backups are written straight to a file in BACKUP_DIR. Tables and the admin
+# config are deflated; photos are already compressed and are stored as-is.
+# An incremental backup holds the current tables plus only the photos added
+# since the photos recorded in BACKUP_MANIFEST. The Parquet attendance
+# archive is always included in full. Every archive carries a manifest.json
+# listing its files with size and SHA-256.
+# Restoring photos needs the newest full backup and every incremental taken
+# after it, so rotation never deletes those; an incremental whose full backup
+# is gone is written as a full one instead.
+
+BACKUP_DIR = "backups"
+BACKUP_MANIFEST = os.path.join(BACKUP_DIR, "backup_manifest.json")
+BACKUPS_KEPT = 3
+TABLE_FILES = {"users": "users_db.csv", "attendance": "attendance_db.csv"}
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def photo_sha256(path):
+    """SHA-256 of a photo; free for content-addressed names"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return stem
+    return _sha256(path)
+
+def _write_table(zf, arcname, df):
+    with zf.open(arcname, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+        df.to_csv(f, index=False)
+
+def create_backup(db, upload_dir, admin_file, backup_dir=BACKUP_DIR, incremental=False,
+                  manifest_path=BACKUP_MANIFEST, archive_dir=archive.ARCHIVE_DIR):
+    """Write a backup ZIP to disk and return its path"""
+    os.makedirs(backup_dir, exist_ok=True)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    base = manifest.get("base")
+    if not (base and os.path.exists(os.path.join(backup_dir, base))):
+        incremental = False
+    previous = manifest.get("photos", {}) if incremental else {}
+
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    kind = "incremental" if incremental else "full"
+    path = os.path.join(backup_dir, f"backup_{stamp}_{kind}.zip")
+    tmp = f"{path}.part"
+    files, photos = {}, {}
+
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for table, arcname in TABLE_FILES.items():
+            df = db.load_users() if table == "users" else db.load_attendance()
+            _write_table(zf, arcname, df)
+            files[arcname] = {"rows": len(df)}
+        if os.path.exists(admin_file):
+            zf.write(admin_file, "admin_config.json")
+            files["admin_config.json"] = {"size": os.path.getsize(admin_file)}
+
+        for root, _, names in os.walk(archive_dir):
+            for name in names:
+                if name.endswith(".part"):
+                    continue
+                file_path = os.path.join(root, name)
+                arcname = "archive/" + os.path.relpath(file_path, archive_dir).replace(os.sep, "/")
+                zf.write(file_path, arcname, compress_type=zipfile.ZIP_STORED)
+                files[arcname] = {"size": os.path.getsize(file_path), "sha256": _sha256(file_path)}
+
+        for root, _, names in os.walk(upload_dir):
+            for name in names:
+                if name.endswith(".part"):
+                    continue
+                file_path = os.path.join(root, name)
+                relpath = os.path.relpath(file_path, upload_dir).replace(os.sep, "/")
+                size = os.path.getsize(file_path)
+                photos[relpath] = size
+                if incremental and previous.get(relpath) == size:
+                    continue
+                arcname = f"uploads/{relpath}"
+                zf.write(file_path, arcname, compress_type=zipfile.ZIP_STORED)
+                files[arcname] = {"size": size, "sha256": photo_sha256(file_path)}
+
+        zf.writestr("manifest.json", json.dumps({
+            "created": stamp, "incremental": incremental, "files": files,
+        }, indent=1))
+    os.replace(tmp, path)
+
+    if incremental:
+        previous.update(photos)
+        photos = previous
+    else:
+        base = os.path.basename(path)
+    with open(manifest_path, "w") as f:
+        json.dump({"created": stamp, "base": base, "photos": photos}, f)
+
+    _rotate_backups(backup_dir)
+    return path
+
+def _rotate_backups(backup_dir=BACKUP_DIR, kept=BACKUPS_KEPT):
+    """Delete old archives, keeping the latest `kept` and the newest full backup with its incrementals"""
+    archives = sorted(e.name for e in os.scandir(backup_dir) if e.name.startswith("backup_") and e.name.endswith(".zip"))
+    fulls = [i for i, name in enumerate(archives) if name.endswith("_full.zip")]
+    first_kept = len(archives) - kept
+    if fulls:
+        first_kept = min(first_kept, fulls[-1])
+    for name in archives[:max(first_kept, 0)]:
+        os.remove(os.path.join(backup_dir, name))
+
+# ------------------------------------------------
+# BACKUP IMPORT
+# ------------------------------------------------
+# The archive is checked (paths, total size, free space, table schemas)
+# before anything is written. Photos already present with the same SHA-256
+# are skipped and the rest are extracted in parallel, each through a
+# temporary file. The tables are swapped in last, in one step, so a failed
+# import never leaves half-written tables behind.
+
+MAX_IMPORT_BYTES = int(os.getenv("MAX_IMPORT_BYTES", str(20 * 1024 ** 3)))
+IMPORT_WORKERS = 4
+REQUIRED_COLUMNS = {
+    "users_db.csv": ["Name", "Roll_No", "Organisation", "Group"],
+    "attendance_db.csv": ["Group", "Name", "Roll_No"],
+}
+
+def _check_member(name):
+    parts = name.split("/")
+    if name.startswith("/") or "\\" in name or ".." in parts or ":" in parts[0]:
+        raise ValueError(f"Unsafe path in backup: {name}")
+    if name.endswith("/"):
+        return None
+    if name in REQUIRED_COLUMNS or name in ("admin_config.json", "manifest.json"):
+        return name
+    if parts[0] in ("uploads", "archive") and len(parts) > 1:
+        return name
+    raise ValueError(f"Unexpected file in backup: {name}")
+
+def _extract(archive_path, name, dest, expected=None):
+    """Copy one member to a temp file next to `dest`, checking its SHA-256
+    against `expected`; returns the temp path"""
+    h = hashlib.sha256()
+    with zipfile.ZipFile(archive_path) as zf, zf.open(name) as src:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: src.read(1 << 20), b""):
+                h.update(chunk)
+                out.write(chunk)
+    if expected is not None and h.hexdigest() != expected:
+        os.remove(tmp)
+        raise ValueError(f"{name} does not match its checksum in manifest.json")
+    return tmp
+
+def import_backup(db, archive_path, upload_dir, admin_file, workers=IMPORT_WORKERS,
+                  archive_dir=archive.ARCHIVE_DIR):
+    """Restore a backup ZIP from `archive_path`; returns a summary dict.
+
+    Raises ValueError (and changes nothing) if the archive is invalid.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with zipfile.ZipFile(archive_path) as zf:
+        infos = [i for i in zf.infolist() if _check_member(i.filename)]
+        total = sum(i.file_size for i in infos)
+        if total > MAX_IMPORT_BYTES:
+            raise ValueError(f"Backup expands to {total / 1024 ** 3:.1f} GB, over the {MAX_IMPORT_BYTES / 1024 ** 3:.1f} GB limit")
+        os.makedirs(upload_dir, exist_ok=True)
+        if total > shutil.disk_usage(upload_dir).free:
+            raise ValueError("Not enough free disk space to import this backup")
+
+        names = {i.filename for i in infos}
+        manifest = json.loads(zf.read("manifest.json")).get("files", {}) if "manifest.json" in names else {}
+        absent = sorted(set(manifest) - names)
+        if absent:
+            raise ValueError(f"Backup is incomplete, missing: {', '.join(absent[:5])}")
+
+        tables = {}
+        for name, required in REQUIRED_COLUMNS.items():
+            if name not in names:
+                continue
+            with zf.open(name) as f:
+                df = storage.read_table(f)
+            missing = [c for c in required if c not in df.columns]
+            if missing:
+                raise ValueError(f"{name} is missing column(s): {', '.join(missing)}")
+            rows = manifest.get(name, {}).get("rows")
+            if rows is not None and rows != len(df):
+                raise ValueError(f"{name} has {len(df)} rows, manifest.json lists {rows}")
+            tables[name] = df
+        admin = zf.read("admin_config.json") if "admin_config.json" in names else None
+        if admin is not None:
+            config = json.loads(admin)
+            if not isinstance(config, dict) or not {"username", "password"} <= set(config):
+                raise ValueError("admin_config.json must contain username and password")
+
+    todo, skipped = [], 0
+    for info in infos:
+        parts = info.filename.split("/")
+        if parts[0] not in ("uploads", "archive"):
+            continue
+        dest = os.path.join(upload_dir if parts[0] == "uploads" else archive_dir, *parts[1:])
+        expected = manifest.get(info.filename, {}).get("sha256")
+        if os.path.exists(dest) and os.path.getsize(dest) == info.file_size and (
+                expected is None or photo_sha256(dest) == expected):
+            skipped += 1
+            continue
+        todo.append((info.filename, dest, expected))
+
+    # Every file is extracted and verified before any is moved into place, so
+    # a corrupt member leaves the current data untouched
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(_extract, archive_path, *item) for item in todo]
+    failed = [job.exception() for job in jobs if job.exception() is not None]
+    if failed:
+        for job in jobs:
+            if job.exception() is None:
+                os.remove(job.result())
+        raise failed[0]
+    # The archive manifest goes last so it never lists a partition not yet on disk
+    moves = sorted(zip(todo, (job.result() for job in jobs)),
+                   key=lambda move: move[0][0] == f"archive/{archive.ARCHIVE_MANIFEST}")
+    for (_, dest, _), tmp in moves:
+        os.replace(tmp, dest)
+
+    if len(tables) == len(REQUIRED_COLUMNS):
+        db.replace_all(tables["users_db.csv"], tables["attendance_db.csv"])
+    elif "users_db.csv" in tables:
+        db.replace_users(tables["users_db.csv"])
+    elif "attendance_db.csv" in tables:
+        db.replace_attendance(tables["attendance_db.csv"])
+    if admin is not None:
+        tmp = f"{admin_file}.part"
+        with open(tmp, "wb") as f:
+            f.write(admin)
+        os.replace(tmp, admin_file)
+
+    return {"extracted": len(todo), "skipped": skipped,
+            "users": len(tables["users_db.csv"]) if "users_db.csv" in tables else None,
+            "attendance": len(tables["attendance_db.csv"]) if "attendance_db.csv" in tables else None}
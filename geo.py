@@ -0,0 +1,401 @@
+import csv
+import io
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ------------------------------------------------
+# GEOHASH
+# ------------------------------------------------
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat, lon, precision=7):
+    """Encode a coordinate as a geohash string (precision 7 is a ~150 m cell)"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+# ------------------------------------------------
+# REVERSE-GEOCODE CACHE
+# ------------------------------------------------
+GEOCODE_CACHE_DB = os.getenv("GEOCODE_CACHE_DB", "geocode_cache.sqlite")
+GEOCODE_PRECISION = 7
+GEOCODE_TTL = 30 * 24 * 3600
+GEOCODE_MAX_ENTRIES = 20000
+MEMORY_ENTRIES = 2048
+
+
+class GeocodeCache:
+    """On-disk address cache keyed by geohash cell, with TTL and LRU eviction.
+
+    A small in-memory LRU sits in front of the SQLite file so repeated
+    lookups of the same site never touch the disk.
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_DB, ttl=GEOCODE_TTL, max_entries=GEOCODE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._con:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS geocode (cell TEXT PRIMARY KEY, address TEXT, "
+                "created REAL, last_used REAL)"
+            )
+            self._con.execute("CREATE INDEX IF NOT EXISTS idx_geocode_last_used ON geocode (last_used)")
+
+    def get(self, cell):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(cell)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(cell)
+                return entry[0]
+
+            row = self._con.execute("SELECT address, created FROM geocode WHERE cell = ?", (cell,)).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                return None
+            with self._con:
+                self._con.execute("UPDATE geocode SET last_used = ? WHERE cell = ?", (now, cell))
+            self._remember(cell, row[0], row[1])
+            return row[0]
+
+    def put(self, cell, address):
+        now = time.time()
+        with self._lock:
+            with self._con:
+                self._con.execute(
+                    "INSERT OR REPLACE INTO geocode (cell, address, created, last_used) VALUES (?, ?, ?, ?)",
+                    (cell, address, now, now),
+                )
+                self._con.execute("DELETE FROM geocode WHERE created < ?", (now - self.ttl,))
+                self._con.execute(
+                    "DELETE FROM geocode WHERE cell IN (SELECT cell FROM geocode ORDER BY last_used DESC "
+                    "LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+            self._remember(cell, address, now)
+
+    def _remember(self, cell, address, created):
+        self._memory[cell] = (address, created)
+        self._memory.move_to_end(cell)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+
+class RateLimiter:
+    """Allow at most one call per `interval` seconds across all sessions"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=0.0):
+        """Reserve a slot, sleeping up to max_wait seconds; False if none is free in time"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next - now)
+            if wait > max_wait:
+                return False
+            self._next = max(now, self._next) + self.interval
+        if wait:
+            time.sleep(wait)
+        return True
+
+# ------------------------------------------------
+# OFFLINE GAZETTEER
+# ------------------------------------------------
+# PLACES_FILE is a CSV of named sites (columns name, lat, lon) provided by
+# the admin. Points are indexed as unit vectors in a 3-d KD-tree, so the
+# straight-line nearest neighbour is also the nearest on the globe.
+PLACES_FILE = os.getenv("PLACES_FILE", "places.csv")
+EARTH_RADIUS_KM = 6371.0
+OFFLINE_RADIUS_KM = 2.0
+
+NAME_COLUMNS = ("name", "place", "site")
+LAT_COLUMNS = ("lat", "latitude")
+LON_COLUMNS = ("lon", "lng", "long", "longitude")
+
+def _unit_vector(lat, lon):
+    la, lo = math.radians(lat), math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+class KDTree:
+    """Minimal static KD-tree over 3-d points for nearest-neighbour queries"""
+
+    def __init__(self, points):
+        # Nodes are (point, index, axis, left, right)
+        self.root = self._build([(p, i) for i, p in enumerate(points)], 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        mid = len(items) // 2
+        point, index = items[mid]
+        return (point, index, axis, self._build(items[:mid], depth + 1), self._build(items[mid + 1:], depth + 1))
+
+    def nearest(self, target):
+        """(index, squared distance) of the point closest to target"""
+        best = [None, float("inf")]
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, index, axis, left, right = node
+            d2 = sum((a - b) ** 2 for a, b in zip(point, target))
+            if d2 < best[1]:
+                best = [index, d2]
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            if diff * diff < best[1]:
+                stack.append(far)
+            stack.append(near)
+        return best[0], best[1]
+
+
+class Gazetteer:
+    """Named places with a KD-tree index"""
+
+    def __init__(self, places):
+        self.names = [name for name, _, _ in places]
+        self.tree = KDTree([_unit_vector(lat, lon) for _, lat, lon in places])
+
+    def __len__(self):
+        return len(self.names)
+
+    def nearest(self, lat, lon):
+        """(place name, distance in km) of the closest known place"""
+        index, d2 = self.tree.nearest(_unit_vector(lat, lon))
+        chord = math.sqrt(d2)
+        return self.names[index], 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def parse_places(text):
+    """Parse places CSV text into [(name, lat, lon)]; raises ValueError on bad input"""
+    reader = csv.DictReader(io.StringIO(text))
+    fields = {f.strip().lower(): f for f in (reader.fieldnames or [])}
+
+    def column(options, label):
+        for option in options:
+            if option in fields:
+                return fields[option]
+        raise ValueError(f"Places file needs a {label} column ({', '.join(options)})")
+
+    name_col, lat_col, lon_col = column(NAME_COLUMNS, "name"), column(LAT_COLUMNS, "latitude"), column(LON_COLUMNS, "longitude")
+    places = []
+    for line, row in enumerate(reader, start=2):
+        try:
+            lat, lon = float(row[lat_col]), float(row[lon_col])
+        except (TypeError, ValueError):
+            raise ValueError(f"Line {line}: invalid coordinates")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not (row[name_col] or "").strip():
+            raise ValueError(f"Line {line}: missing name or coordinates out of range")
+        places.append((row[name_col].strip(), lat, lon))
+    if not places:
+        raise ValueError("Places file is empty")
+    return places
+
+_gazetteer = {}
+
+def load_gazetteer(path=PLACES_FILE):
+    """Gazetteer for `path`, rebuilt when the file changes; None if there is none"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    sig = (path, st.st_mtime_ns, st.st_size)
+    entry = _gazetteer.get(path)
+    if entry is None or entry[0] != sig:
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                gazetteer = Gazetteer(parse_places(f.read()))
+        except (OSError, ValueError) as e:
+            print(f"Could not load places file {path}: {e}")
+            gazetteer = None
+        entry = (sig, gazetteer)
+        _gazetteer[path] = entry
+    return entry[1]
+
+def save_places(text, path=PLACES_FILE):
+    """Validate and install an admin-provided places CSV; returns the number of places"""
+    places = parse_places(text)
+    tmp = f"{path}.part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return len(places)
+
+def offline_geocode(lat, lon, gazetteer):
+    """(nearest place name, distance in km); places beyond OFFLINE_RADIUS_KM
+    are named with their distance"""
+    name, km = gazetteer.nearest(lat, lon)
+    return (name if km <= OFFLINE_RADIUS_KM else f"{name} ({km:.1f} km away)"), km
+
+# ------------------------------------------------
+# REVERSE GEOCODING
+# ------------------------------------------------
+# "online": Nominatim only. "offline": local gazetteer only.
+# "hybrid": gazetteer when a known place is within OFFLINE_RADIUS_KM,
+# otherwise Nominatim (also the fallback when no places file exists); if
+# Nominatim gives no answer the distant gazetteer place is used.
+GEOCODER_MODE = os.getenv("GEOCODER_MODE", "hybrid")
+
+# Nominatim's usage policy allows one request per second.
+NOMINATIM_INTERVAL = 1.0
+GEOCODE_TIMEOUT = 5
+GEOCODE_MAX_WAIT = 2.0
+
+_default = {}
+_default_lock = threading.Lock()
+
+def _defaults():
+    with _default_lock:
+        if not _default:
+            from geopy.geocoders import Nominatim
+
+            _default["geocoder"] = Nominatim(user_agent="attendance_app", timeout=GEOCODE_TIMEOUT)
+            _default["cache"] = GeocodeCache()
+            _default["limiter"] = RateLimiter(NOMINATIM_INTERVAL)
+        return _default
+
+def reverse_geocode(lat, lon, geocoder=None, cache=None, limiter=None, mode=None, gazetteer=None):
+    """Address for a coordinate, from the local gazetteer or the geohash-cell cache when possible.
+
+    `geocoder` is anything with a geopy-style reverse(query, language=...)
+    method, so a local stub can stand in for Nominatim.
+    """
+    mode = mode or GEOCODER_MODE
+    fallback = "Unknown"
+    if mode != "online":
+        gazetteer = load_gazetteer() if gazetteer is None else gazetteer
+        if gazetteer:
+            place, km = offline_geocode(lat, lon, gazetteer)
+            if mode == "offline" or km <= OFFLINE_RADIUS_KM:
+                return place
+            fallback = place
+        elif mode == "offline":
+            return "Unknown"
+
+    if geocoder is None or cache is None or limiter is None:
+        defaults = _defaults()
+        geocoder = geocoder or defaults["geocoder"]
+        cache = cache or defaults["cache"]
+        limiter = limiter or defaults["limiter"]
+
+    cell = geohash(lat, lon, GEOCODE_PRECISION)
+    address = cache.get(cell)
+    if address is not None:
+        return fallback if address == "Unknown" else address
+
+    if not limiter.acquire(GEOCODE_MAX_WAIT):
+        return fallback
+    try:
+        loc = geocoder.reverse(f"{lat},{lon}", language="en")
+    except Exception:
+        return fallback
+    address = loc.address if loc else "Unknown"
+    cache.put(cell, address)
+    return fallback if address == "Unknown" else address
+
+# ------------------------------------------------
+# CONCURRENT LOCATION ENRICHMENT
+# ------------------------------------------------
+# The photo address and the upload location are looked up in parallel on a
+# shared worker pool with pooled HTTP sessions. The page waits at most
+# ENRICH_BUDGET seconds and shows "Pending" for lookups still running; the
+# futures are kept so the next rerun picks up their results.
+ENRICH_BUDGET = 2.5
+HTTP_TIMEOUT = (3, 5)  # connect, read
+PENDING = "Pending"
+
+_http = threading.local()
+_pool = []
+_pool_lock = threading.Lock()
+
+def _executor():
+    with _pool_lock:
+        if not _pool:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _pool.append(ThreadPoolExecutor(max_workers=8, thread_name_prefix="enrich"))
+        return _pool[0]
+
+def http_session():
+    """Per-thread requests.Session so connections are reused between lookups"""
+    session = getattr(_http, "session", None)
+    if session is None:
+        import requests
+
+        session = requests.Session()
+        _http.session = session
+    return session
+
+def get_upload_location():
+    try:
+        session = http_session()
+        ip = session.get("https://api64.ipify.org?format=json", timeout=HTTP_TIMEOUT).json()["ip"]
+        info = session.get(f"https://ipinfo.io/{ip}/json", timeout=HTTP_TIMEOUT).json()
+        return f"{info.get('city','Unknown')}, {info.get('region','Unknown')}"
+    except Exception:
+        return "Unknown"
+
+def submit(fn, *args):
+    """Run fn(*args) on the enrichment pool and return its future"""
+    return _executor().submit(fn, *args)
+
+def start_enrichment(lat, lon, upload_job):
+    """Start the lookups for one photo; `upload_job` is the session's upload-location future"""
+    photo_job = submit(reverse_geocode, lat, lon) if lat and lon else None
+    return {"photo": photo_job, "upload": upload_job}
+
+def collect(jobs, budget=ENRICH_BUDGET):
+    """Wait up to `budget` seconds in total; returns {name: result or PENDING}"""
+    from concurrent.futures import wait
+
+    futures = [f for f in jobs.values() if f is not None]
+    if futures:
+        wait(futures, timeout=budget)
+    results = {}
+    for name, future in jobs.items():
+        if future is None:
+            results[name] = "Unknown"
+        elif future.done():
+            results[name] = future.result() if future.exception() is None else "Unknown"
+        else:
+            results[name] = PENDING
+    return results
+
+# Attendance column each enrichment lookup fills
+LOCATION_COLUMNS = {"photo": "Photo_Location", "upload": "Upload_Location"}
+
+def backfill(jobs, pending, write):
+    """Hand the `pending` lookups of `jobs` to `write({column: place})` once
+    they finish; failed lookups keep what was recorded"""
+    for name in pending:
+        def done(future, column=LOCATION_COLUMNS[name]):
+            if future.exception() is None:
+                write({column: future.result()})
+        jobs[name].add_done_callback(done)
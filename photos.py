@@ -0,0 +1,247 @@
+import hashlib
+import os
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+
+import archive
+
+# ------------------------------------------------
+# PHOTO INGEST
+# ------------------------------------------------
+# Uploaded photos are stored byte-for-byte as received. Pillow's Image.open
+# only parses the file header (including the EXIF segment), so nothing
+# here decodes or re-encodes pixels.
+
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "MPO": ".jpg"}
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+GPS_LATITUDE_REF, GPS_LATITUDE = 1, 2
+GPS_LONGITUDE_REF, GPS_LONGITUDE = 3, 4
+
+def dms_to_dd(dms):
+    """Convert GPS coordinates from DMS (degrees, minutes, seconds) to DD (decimal degrees)"""
+    try:
+        if isinstance(dms, tuple) and len(dms) == 3:
+            degrees = float(dms[0][0]) / float(dms[0][1]) if isinstance(dms[0], tuple) else float(dms[0])
+            minutes = float(dms[1][0]) / float(dms[1][1]) if isinstance(dms[1], tuple) else float(dms[1])
+            seconds = float(dms[2][0]) / float(dms[2][1]) if isinstance(dms[2], tuple) else float(dms[2])
+            return degrees + (minutes / 60.0) + (seconds / 3600.0)
+        else:
+            # Handle cases where DMS might be stored as simple floats
+            return float(dms)
+    except (TypeError, ValueError, IndexError, ZeroDivisionError):
+        return None
+
+def parse_exif(raw):
+    """Capture time and GPS position from a raw EXIF block (bytes)"""
+    if not raw:
+        return None, None, None
+    try:
+        exif = Image.Exif()
+        exif.load(raw)
+
+        capture_time = exif.get_ifd(EXIF_IFD).get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)
+
+        gps = exif.get_ifd(GPS_IFD)
+        lat, lon = None, None
+        if GPS_LATITUDE in gps:
+            lat = dms_to_dd(gps[GPS_LATITUDE])
+            if gps.get(GPS_LATITUDE_REF) == "S" and lat:
+                lat = -lat
+        if GPS_LONGITUDE in gps:
+            lon = dms_to_dd(gps[GPS_LONGITUDE])
+            if gps.get(GPS_LONGITUDE_REF) == "W" and lon:
+                lon = -lon
+
+        return capture_time, lat, lon
+    except Exception as e:
+        print(f"Error extracting EXIF data: {e}")
+        return None, None, None
+
+def inspect_photo(data):
+    """Return (extension, capture_time, lat, lon) for uploaded image bytes.
+
+    Raises PIL.UnidentifiedImageError / ValueError for files that are not a
+    supported image.
+    """
+    with Image.open(BytesIO(data)) as img:
+        ext = EXTENSIONS.get(img.format)
+        if ext is None:
+            raise ValueError(f"Unsupported image format: {img.format}")
+        raw = img.info.get("exif")
+    capture_time, lat, lon = parse_exif(raw)
+    return ext, capture_time, lat, lon
+
+def save_photo(data, path):
+    """Write photo bytes to `path` atomically"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+# ------------------------------------------------
+# STAGING
+# ------------------------------------------------
+# Every rerun with a photo in the uploader stages it under its SHA-256, so
+# repeated reruns reuse one file. Only "Submit Attendance" moves it into the
+# uploads directory; a background thread removes staged files nobody
+# submitted.
+
+STAGING_TTL = 6 * 3600
+STAGING_GC_INTERVAL = 600
+
+_gc_lock = threading.Lock()
+_gc_started = set()
+
+def stage_photo(data, staging_dir, ext):
+    """Stage photo bytes under their content hash; returns the staged path"""
+    os.makedirs(staging_dir, exist_ok=True)
+    path = os.path.join(staging_dir, hashlib.sha256(data).hexdigest() + ext)
+    if os.path.exists(path):
+        os.utime(path)  # keep it alive while the user is still on the page
+    else:
+        save_photo(data, path)
+    return path
+
+def collect_staging(staging_dir, max_age=STAGING_TTL):
+    """Delete staged photos older than max_age seconds; returns how many were removed"""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(staging_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def start_staging_gc(staging_dir, max_age=STAGING_TTL, interval=STAGING_GC_INTERVAL):
+    """Start the staging garbage collector thread (once per process and directory)"""
+    with _gc_lock:
+        if staging_dir in _gc_started:
+            return
+        _gc_started.add(staging_dir)
+
+    def run():
+        while True:
+            try:
+                collect_staging(staging_dir, max_age)
+            except Exception as e:
+                print(f"Staging cleanup failed: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=run, name="staging-gc", daemon=True).start()
+
+# ------------------------------------------------
+# CONTENT-ADDRESSED PHOTO STORE
+# ------------------------------------------------
+# Photos live under UPLOAD_DIR/<h[0:2]>/<h[2:4]>/<sha256><ext>; the
+# attendance table's Image_File column holds that relative path. Identical
+# uploads share one file, which is deleted once no attendance row refers to
+# it any more.
+
+def photo_relpath(digest, ext):
+    return "/".join([digest[:2], digest[2:4], digest + ext])
+
+def _move_into_store(src, upload_dir, relpath):
+    dest = os.path.join(upload_dir, *relpath.split("/"))
+    if os.path.exists(dest):
+        os.remove(src)  # already stored - duplicates cost nothing
+    else:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src, dest)
+
+def commit_photo(data, staged_path, upload_dir):
+    """Move a staged photo into the store; returns its Image_File path.
+
+    If the staged copy was already collected or committed by another session,
+    the bytes are written again.
+    """
+    name = os.path.basename(staged_path)
+    digest, ext = os.path.splitext(name)
+    relpath = photo_relpath(digest, ext)
+    try:
+        _move_into_store(staged_path, upload_dir, relpath)
+    except FileNotFoundError:
+        dest = os.path.join(upload_dir, *relpath.split("/"))
+        if not os.path.exists(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            save_photo(data, dest)
+    return relpath
+
+def photo_refcounts(att):
+    """Image_File -> number of attendance rows referring to it"""
+    if "Image_File" not in att.columns:
+        return {}
+    return att["Image_File"].dropna().value_counts().to_dict()
+
+def release_photos(upload_dir, image_files, att):
+    """Delete photos in `image_files` that no row of `att` references any more"""
+    refs = photo_refcounts(att)
+    removed = 0
+    for relpath in set(image_files):
+        if not isinstance(relpath, str) or not relpath or refs.get(relpath, 0) > 0:
+            continue
+        try:
+            os.remove(os.path.join(upload_dir, *relpath.split("/")))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def migrate_flat_uploads(db, upload_dir, archive_dir=archive.ARCHIVE_DIR):
+    """Move legacy flat uploads/<name>.jpg files into the sharded store.
+
+    Image_File values of the attendance table are rewritten to the new
+    relative paths in one table write, and those of archived attendance in
+    the Parquet part files. Returns the number of files moved.
+    """
+    mapping = {}
+    for entry in list(os.scandir(upload_dir)):
+        if not entry.is_file() or entry.name.endswith(".part"):
+            continue
+        ext = os.path.splitext(entry.name)[1].lower() or ".jpg"
+        relpath = photo_relpath(_file_digest(entry.path), ext)
+        _move_into_store(entry.path, upload_dir, relpath)
+        mapping[entry.name] = relpath
+
+    if mapping:
+        db.remap_attendance("Image_File", mapping)
+        archive.remap_archive("Image_File", mapping, archive_dir)
+    return len(mapping)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import storage
+
+    parser = argparse.ArgumentParser(description="Photo store utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="move flat uploads/ files into the content-addressed store")
+    mig.add_argument("--uploads", default="uploads")
+    mig.add_argument("--users", default="users_db.csv")
+    mig.add_argument("--attendance", default="attendance_db.csv")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        moved = migrate_flat_uploads(storage.open_backend(args.users, args.attendance), args.uploads)
+        print(f"Moved {moved} photo(s) into {args.uploads}/")
@@ -0,0 +1,288 @@
+import os
+import sqlite3
+import threading
+from datetime import date
+
+import pandas as pd
+
+import archive
+
+# ------------------------------------------------
+# ATTENDANCE ROLLUPS
+# ------------------------------------------------
+# Materialized aggregates for the Dashboard page, kept in ROLLUPS_DB:
+#   daily_counts  (day, group, program) -> check-ins
+#   daily_intern  (day, roll)           -> check-ins (one row per intern and
+#                                          day, so distinct attendees is a COUNT)
+#   last_seen     (roll)                -> latest capture date/time
+# Each submit updates them in place; any other change to the attendance
+# table or the archive (deletes, imports, resets, archiving) is detected
+# through the stored source version and triggers a rebuild from the raw
+# rows, hot and archived, the next time the Dashboard refreshes them.
+# Submits never rebuild: once the rollups are stale they only append.
+# Location write-backs after a submit do not touch any aggregate and keep
+# the rollups current.
+
+ROLLUPS_DB = os.getenv("ROLLUPS_DB", "rollups.sqlite")
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS daily_counts (day TEXT, "group" TEXT, program TEXT, checkins INTEGER, '
+    'PRIMARY KEY (day, "group", program))',
+    'CREATE TABLE IF NOT EXISTS daily_intern (day TEXT, roll TEXT, name TEXT, "group" TEXT, checkins INTEGER, '
+    "PRIMARY KEY (day, roll))",
+    'CREATE TABLE IF NOT EXISTS last_seen (roll TEXT PRIMARY KEY, name TEXT, "group" TEXT, day TEXT, time TEXT)',
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+]
+ROLLUP_TABLES = ["daily_counts", "daily_intern", "last_seen"]
+# Attendance columns the rollups are computed from
+ROLLUP_COLUMNS = {"Capture_Date", "Capture_Time", "Group", "Name", "Roll_No"}
+
+def _day(value):
+    """ISO day of a Capture_Date, or "" if it is missing or not a real date (EXIF 0000:00:00)"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    day = str(value)[:10]
+    try:
+        date.fromisoformat(day)
+    except ValueError:
+        return ""
+    return day
+
+def _text(value):
+    return "" if value is None or (isinstance(value, float) and pd.isna(value)) else str(value)
+
+
+class Rollups:
+    """Incrementally maintained attendance aggregates"""
+
+    def __init__(self, path=ROLLUPS_DB):
+        self.path = path
+        self._lock = threading.RLock()
+        self._con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._con:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self._con.execute(statement)
+
+    # ---------- maintenance ----------
+    def _version(self):
+        row = self._con.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _source_version(db):
+        return db.version("attendance"), archive.version()
+
+    def _set_version(self, version):
+        self._con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (repr(version),))
+
+    def _add(self, row, program):
+        day, roll = _day(row.get("Capture_Date")), _text(row.get("Roll_No"))
+        group, name, clock = _text(row.get("Group")), _text(row.get("Name")), _text(row.get("Capture_Time"))
+        con = self._con
+        con.execute('INSERT INTO daily_counts VALUES (?, ?, ?, 1) ON CONFLICT (day, "group", program) '
+                    "DO UPDATE SET checkins = checkins + 1", (day, group, _text(program)))
+        con.execute("INSERT INTO daily_intern VALUES (?, ?, ?, ?, 1) ON CONFLICT (day, roll) "
+                    "DO UPDATE SET checkins = checkins + 1", (day, roll, name, group))
+        con.execute('INSERT INTO last_seen VALUES (?, ?, ?, ?, ?) ON CONFLICT (roll) DO UPDATE SET '
+                    'name = excluded.name, "group" = excluded."group", day = excluded.day, time = excluded.time '
+                    "WHERE excluded.day || ' ' || excluded.time >= last_seen.day || ' ' || last_seen.time",
+                    (roll, name, group, day, clock))
+
+    def record(self, db, row, program):
+        """Append an attendance row and fold it into the rollups if they are
+        current; returns its Record_Id"""
+        with self._lock:
+            stale = self._version() != repr(self._source_version(db))
+            record_id = db.append_attendance(row)
+            if stale:
+                return record_id  # refresh() rebuilds, this row included
+            with self._con:
+                self._add(row, program)
+                self._set_version(self._source_version(db))
+            return record_id
+
+    def update(self, db, record_id, values):
+        """Change fields of one record; the rollups stay current when none of
+        them is aggregated (a late location lookup). Returns False if there is
+        no such record"""
+        with self._lock:
+            stale = self._version() != repr(self._source_version(db))
+            if not db.update_attendance(record_id, values):
+                return False
+            if not stale and not ROLLUP_COLUMNS.intersection(values):
+                with self._con:
+                    self._set_version(self._source_version(db))
+            return True
+
+    def rebuild(self, db):
+        """Recompute every rollup from the attendance table"""
+        with self._lock:
+            version = self._source_version(db)
+            att = archive.attendance_history(db)
+            users = db.load_users()
+            programs = users.dropna(subset=["Roll_No"]).drop_duplicates("Roll_No").set_index("Roll_No")["Organisation"]
+
+            def text(col, convert=_text):
+                return att[col].astype(object).map(convert) if col in att.columns else ""
+
+            frame = pd.DataFrame({
+                "day": text("Capture_Date", _day),
+                "time": text("Capture_Time"),
+                "group": text("Group"),
+                "name": text("Name"),
+                "roll": text("Roll_No"),
+            })
+            frame["program"] = frame["roll"].map(programs).map(_text)
+
+            daily_counts = frame.groupby(["day", "group", "program"]).size().reset_index(name="checkins")
+            daily_intern = (frame.groupby(["day", "roll"])
+                            .agg(name=("name", "last"), group=("group", "last"), checkins=("name", "size"))
+                            .reset_index())
+            last_seen = (frame.assign(stamp=frame["day"] + " " + frame["time"])
+                         .sort_values("stamp", kind="stable")
+                         .drop_duplicates("roll", keep="last")[["roll", "name", "group", "day", "time"]])
+
+            with self._con:
+                for table in ROLLUP_TABLES:
+                    self._con.execute(f"DELETE FROM {table}")
+                self._con.executemany("INSERT INTO daily_counts VALUES (?, ?, ?, ?)",
+                                      daily_counts[["day", "group", "program", "checkins"]].itertuples(index=False))
+                self._con.executemany("INSERT INTO daily_intern VALUES (?, ?, ?, ?, ?)",
+                                      daily_intern[["day", "roll", "name", "group", "checkins"]].itertuples(index=False))
+                self._con.executemany("INSERT INTO last_seen VALUES (?, ?, ?, ?, ?)",
+                                      last_seen.itertuples(index=False))
+                self._set_version(version)
+
+    def refresh(self, db):
+        """Rebuild if the attendance table changed other than through record()"""
+        with self._lock:
+            if self._version() != repr(self._source_version(db)):
+                self.rebuild(db)
+
+    # ---------- queries ----------
+    def _query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._con, params=params)
+
+    @staticmethod
+    def _where(start, end, groups):
+        clauses, params = ["day BETWEEN ? AND ?"], [str(start), str(end)]
+        if groups:
+            clauses.append(f'"group" IN ({", ".join("?" for _ in groups)})')
+            params.extend(groups)
+        return " WHERE " + " AND ".join(clauses), params
+
+    def date_range(self):
+        with self._lock:
+            # Rollups built before days were validated may still hold e.g. "0000-00-00"
+            row = self._con.execute("SELECT MIN(day), MAX(day) FROM daily_counts "
+                                    "WHERE day >= '0001-01-01' AND date(day) = day").fetchone()
+        return row if row[0] else (None, None)
+
+    def groups(self):
+        with self._lock:
+            return [r[0] for r in self._con.execute('SELECT DISTINCT "group" FROM daily_counts ORDER BY 1')]
+
+    def totals(self, start, end, groups=None):
+        """Check-ins and distinct interns seen in the period"""
+        where, params = self._where(start, end, groups)
+        with self._lock:
+            return self._con.execute(f"SELECT COALESCE(SUM(checkins), 0), COUNT(DISTINCT roll) "
+                                     f"FROM daily_intern{where}", params).fetchone()
+
+    def by_group(self, start, end, groups=None):
+        where, params = self._where(start, end, groups)
+        return self._query(f'SELECT "group", SUM(checkins) AS checkins FROM daily_counts{where} '
+                           'GROUP BY "group" ORDER BY checkins DESC', params)
+
+    def by_program(self, start, end, groups=None):
+        where, params = self._where(start, end, groups)
+        return self._query(f"SELECT program, SUM(checkins) AS checkins FROM daily_counts{where} "
+                           "GROUP BY program ORDER BY checkins DESC", params)
+
+    def daily(self, start, end, groups=None):
+        """Check-ins and distinct attendees per day"""
+        where, params = self._where(start, end, groups)
+        return self._query(f"SELECT day, SUM(checkins) AS checkins, COUNT(*) AS attendees FROM daily_intern{where} "
+                           "GROUP BY day ORDER BY day", params)
+
+    def top_attendees(self, start, end, groups=None, limit=10):
+        where, params = self._where(start, end, groups)
+        return self._query(f'SELECT MAX(name) AS name, roll, MAX("group") AS "group", COUNT(*) AS days, '
+                           f"SUM(checkins) AS checkins FROM daily_intern{where} "
+                           "GROUP BY roll ORDER BY days DESC, checkins DESC LIMIT ?", params + [limit])
+
+    def last_seen(self, groups=None):
+        sql, params = 'SELECT name, roll, "group", day, time FROM last_seen', []
+        if groups:
+            sql += f' WHERE "group" IN ({", ".join("?" for _ in groups)})'
+            params = list(groups)
+        return self._query(sql + " ORDER BY day DESC, time DESC", params)
+
+# ------------------------------------------------
+# GPS CLUSTERS
+# ------------------------------------------------
+# The map never receives raw coordinates: points are binned into a square
+# grid whose cell size follows the zoom level, and only one centroid and
+# count per occupied cell is sent. A cell id ("zoom/x/y") can be drilled
+# into at a finer zoom. Results are cached per (table version, filters, zoom).
+
+MAP_CELLS_PER_TILE = 4  # grid cells across one 256 px map tile
+MAP_CACHE_SIZE = 64
+
+_clusters_lock = threading.Lock()
+_clusters = {}
+
+def cell_size(zoom):
+    """Grid cell edge in degrees at a map zoom level"""
+    return 360.0 / (2 ** zoom) / MAP_CELLS_PER_TILE
+
+def cell_bounds(cell):
+    """(lat_min, lat_max, lon_min, lon_max) of a cell id"""
+    zoom, x, y = (int(part) for part in cell.split("/"))
+    size = cell_size(zoom)
+    return y * size - 90.0, (y + 1) * size - 90.0, x * size - 180.0, (x + 1) * size - 180.0
+
+def cluster_points(lat, lon, zoom):
+    """Bin coordinates into the zoom grid; one row per cell with centroid and count"""
+    size = cell_size(zoom)
+    x = ((lon + 180.0) // size).astype("int64")
+    y = ((lat + 90.0) // size).astype("int64")
+    grouped = pd.DataFrame({"x": x, "y": y, "lat": lat, "lon": lon}).groupby(["x", "y"], sort=False)
+    clusters = grouped.agg(lat=("lat", "mean"), lon=("lon", "mean"), count=("lat", "size")).reset_index()
+    clusters.insert(0, "cell", str(zoom) + "/" + clusters["x"].astype(str) + "/" + clusters["y"].astype(str))
+    # Marker radius in metres: up to half a cell, by the square root of the count
+    scale = (clusters["count"] / max(int(clusters["count"].max()), 1) if len(clusters) else clusters["count"]) ** 0.5
+    clusters["radius"] = (size * 111_000 * 0.5 * scale).clip(lower=size * 111_000 * 0.1)
+    return clusters.drop(columns=["x", "y"]).sort_values("count", ascending=False, ignore_index=True)
+
+def _attendance_points(att, groups):
+    lat = pd.to_numeric(att["Latitude"], errors="coerce").astype("float64")
+    lon = pd.to_numeric(att["Longitude"], errors="coerce").astype("float64")
+    mask = lat.between(-90, 90) & lon.between(-180, 180) & ~((lat == 0) & (lon == 0))
+    if groups:
+        mask &= att["Group"].isin(groups)
+    return lat[mask].to_numpy(), lon[mask].to_numpy()
+
+def location_clusters(db, zoom, start=None, end=None, groups=None, cell=None):
+    """Clusters of attendance GPS points for the map, optionally within one cell"""
+    key = (repr((db.version("attendance"), archive.version())), str(start), str(end), tuple(sorted(groups or ())), zoom, cell)
+    with _clusters_lock:
+        if key in _clusters:
+            _clusters[key] = _clusters.pop(key)  # most recently used last
+            return _clusters[key]
+
+    att = archive.attendance_history(db, start, end, columns=["Group", "Latitude", "Longitude"])
+    lat, lon = _attendance_points(att, groups)
+    if cell is not None:
+        lat_min, lat_max, lon_min, lon_max = cell_bounds(cell)
+        inside = (lat >= lat_min) & (lat < lat_max) & (lon >= lon_min) & (lon < lon_max)
+        lat, lon = lat[inside], lon[inside]
+    clusters = cluster_points(pd.Series(lat, dtype="float64"), pd.Series(lon, dtype="float64"), zoom)
+
+    with _clusters_lock:
+        _clusters[key] = clusters
+        while len(_clusters) > MAP_CACHE_SIZE:
+            _clusters.pop(next(iter(_clusters)))
+    return clusters
@@ -0,0 +1,167 @@
+import threading
+
+import pandas as pd
+
+# ------------------------------------------------
+# IN-MEMORY USER INDEXES
+# ------------------------------------------------
+# Indexes are rebuilt at most once per users-table version (see
+# storage backends' version()) and shared by every session. Users added
+# through register_user/import_roster are folded into the cached indexes
+# instead, so a registration does not re-read the table.
+
+ORGANISATIONS = ["BASM4","BASM2","MAPA2","MAPA4","BASM6","BASM3"]
+
+_lock = threading.RLock()
+_indexes = {}
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and pd.isna(value)) or value == ""
+
+def _cached(name, db, build):
+    version = db.version("users")
+    entry = _indexes.get(name)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _lock:
+        entry = _indexes.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        index = build(db.load_users())
+        _indexes[name] = (version, index)
+        return index
+
+def _add_member(roster, group, name, roll, org):
+    if _missing(group):
+        return
+    members = roster.setdefault(group, {})
+    if not _missing(name) and name not in members:
+        members[name] = (roll, org)
+
+def build_roster(users):
+    """group -> {name: (Roll_No, Organisation)}, both in registration order.
+
+    Groups created from the admin panel have placeholder rows without a name;
+    they appear with an empty roster.
+    """
+    roster = {}
+    for group, name, roll, org in zip(users["Group"], users["Name"], users["Roll_No"], users["Organisation"]):
+        _add_member(roster, group, name, roll, org)
+    return roster
+
+def roster_index(db):
+    """Group -> roster index for the current users table"""
+    return _cached("roster", db, build_roster)
+
+def _add_key(keys, name, roll):
+    if _missing(name) or _missing(roll):
+        return
+    pairs, rolls = keys
+    pairs.add((name, roll))
+    rolls.setdefault(roll, name)
+
+def build_user_keys(users):
+    """Unique indexes over registered users: {(Name, Roll_No)} and {Roll_No: Name}"""
+    keys = (set(), {})
+    for name, roll in zip(users["Name"], users["Roll_No"]):
+        _add_key(keys, name, roll)
+    return keys
+
+def user_keys(db):
+    """(Name, Roll_No) / Roll_No unique indexes for the current users table"""
+    return _cached("user_keys", db, build_user_keys)
+
+def duplicate_error(db, name, roll):
+    """Return why (name, roll) cannot be registered, or None if it is new"""
+    pairs, rolls = user_keys(db)
+    if (name, roll) in pairs:
+        return "User with this name and roll number already exists"
+    if roll in rolls:
+        return f"Roll number {roll} is already registered to {rolls[roll]}"
+    return None
+
+def _append_users(db, rows):
+    """Append users and fold them into indexes built from the table as it was
+    just before; indexes of any other version are left to be rebuilt"""
+    before = db.version("users")
+    db.append_users(rows)
+    after = db.version("users")
+    keys, roster = _indexes.get("user_keys"), _indexes.get("roster")
+    if keys is not None and keys[0] == before:
+        for row in rows:
+            _add_key(keys[1], row["Name"], row["Roll_No"])
+        _indexes["user_keys"] = (after, keys[1])
+    if roster is not None and roster[0] == before:
+        for row in rows:
+            _add_member(roster[1], row["Group"], row["Name"], row["Roll_No"], row["Organisation"])
+        _indexes["roster"] = (after, roster[1])
+
+def register_user(db, row):
+    """Append a new user after an O(1) duplicate check; returns an error message or None"""
+    with _lock:
+        error = duplicate_error(db, row["Name"], row["Roll_No"])
+        if error:
+            return error
+        _append_users(db, [row])
+        return None
+
+# ------------------------------------------------
+# BULK ROSTER IMPORT
+# ------------------------------------------------
+ROSTER_COLUMNS = ["Name","Roll_No","Organisation","Group"]
+COLUMN_ALIASES = {"name": "Name", "full name": "Name", "roll_no": "Roll_No", "roll no": "Roll_No",
+                  "roll number": "Roll_No", "organisation": "Organisation", "organization": "Organisation",
+                  "program": "Organisation", "group": "Group"}
+
+def read_roster(uploaded):
+    """Read an uploaded CSV/XLSX roster with every column as text"""
+    name = getattr(uploaded, "name", str(uploaded)).lower()
+    if name.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(uploaded, dtype=str)
+    else:
+        df = pd.read_csv(uploaded, dtype=str)
+    return df.rename(columns=lambda c: COLUMN_ALIASES.get(str(c).strip().lower(), str(c).strip()))
+
+def validate_roster(df, db):
+    """Validate a roster frame against the rules of the Register page.
+
+    Returns (valid, report): the rows that can be imported, and a per-row
+    error report with the spreadsheet line number of every rejected row.
+    """
+    missing_cols = [c for c in ROSTER_COLUMNS if c not in df.columns]
+    if missing_cols:
+        raise ValueError(f"Roster is missing column(s): {', '.join(missing_cols)}")
+
+    rows = pd.DataFrame({c: df[c].astype("string").str.strip() for c in ROSTER_COLUMNS})
+    pairs, rolls = user_keys(db)
+    dup_pair = rows.duplicated(["Name", "Roll_No"], keep="first")
+    known_pair = pd.Series(pd.MultiIndex.from_arrays([rows["Name"], rows["Roll_No"]]).isin(list(pairs)),
+                           index=rows.index)
+    checks = [
+        (rows["Name"].fillna("") == "", "missing Name"),
+        (rows["Roll_No"].fillna("") == "", "missing Roll_No"),
+        (rows["Group"].fillna("") == "", "missing Group"),
+        (~rows["Organisation"].isin(ORGANISATIONS), f"Organisation must be one of {', '.join(ORGANISATIONS)}"),
+        (dup_pair, "duplicate Name/Roll_No in file"),
+        (rows.duplicated(["Roll_No"], keep="first") & ~dup_pair, "duplicate Roll_No in file"),
+        (known_pair, "already registered"),
+        (rows["Roll_No"].isin(list(rolls)) & ~known_pair, "Roll_No already registered"),
+    ]
+
+    errors = pd.Series("", index=rows.index, dtype="string")
+    for mask, message in checks:
+        mask = mask.fillna(True).astype(bool)
+        errors = errors.where(~mask, errors + message + "; ")
+    bad = errors != ""
+
+    report = rows[bad].assign(Row=rows.index[bad] + 2, Error=errors[bad].str.rstrip("; "))
+    report = report[["Row", "Name", "Roll_No", "Error"]].reset_index(drop=True)
+    return rows[~bad].astype(object).reset_index(drop=True), report
+
+def import_roster(db, df):
+    """Validate a roster and append all valid users in a single write"""
+    with _lock:
+        valid, report = validate_roster(df, db)
+        if not valid.empty:
+            _append_users(db, valid.to_dict("records"))
+        return len(valid), report
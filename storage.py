@@ -0,0 +1,1102 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------
+# TABLE SCHEMAS
+# ------------------------------------------------
+USERS_COLUMNS = ["User_Id","Name","Roll_No","Organisation","Group"]
+ATTEND_COLUMNS = [
+    "Record_Id",
+    "Group","Name","Roll_No",
+    "Capture_Date","Capture_Time","Capture_Ts",
+    "Latitude","Longitude",
+    "Photo_Location","Upload_Location",
+    "Image_File"
+]
+
+# Every attendance record and user carries a stable id (uuid4 hex) that admin
+# operations use instead of row positions
+RECORD_ID = "Record_Id"
+USER_ID = "User_Id"
+
+# Capture_Ts is the capture moment as Unix epoch seconds. Capture_Date and
+# Capture_Time are local wall-clock values in APP_TIMEZONE.
+APP_TIMEZONE = os.getenv("APP_TIMEZONE", "Asia/Kolkata")
+
+# "always" fsyncs every appended record, "interval" at most once per
+# FSYNC_INTERVAL seconds, "never" leaves flushing to the OS.
+FSYNC_POLICY = os.getenv("ATTENDANCE_FSYNC", "always")
+FSYNC_INTERVAL = 1.0
+
+# Single-record deletes and edits of a CSV table are appended to
+# "<table>.journal" and folded in on load; the table is compacted (rewritten
+# with the journal applied) once the journal reaches JOURNAL_COMPACT_BYTES.
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(256 * 1024)))
+
+_write_lock = threading.Lock()
+_headers = {}
+_last_fsync = {}
+
+# Process-wide table cache shared by all sessions: key -> (file signature, DataFrame).
+# Cached frames are read-only; copy before modifying.
+_table_cache = {}
+
+# ------------------------------------------------
+# CSV TABLE FILES
+# ------------------------------------------------
+
+def ensure_table(path, columns):
+    """Create an empty CSV table with the given header if it does not exist"""
+    if not os.path.exists(path):
+        write_table(path, pd.DataFrame(columns=columns))
+
+def write_table(path, df):
+    """Replace a whole CSV table with new contents (resets, imports)"""
+    write_tables({path: df})
+
+def write_tables(tables):
+    """Replace several CSV tables ({path: df}); every file is replaced atomically
+    and only after all of them have been written.
+
+    The new contents supersede the tables' journals, which are dropped. A
+    change computed from a table's current contents must go through
+    rewrite_table() instead, or journalled deletes and edits made meanwhile
+    are lost.
+    """
+    with _write_lock:
+        tmps = {}
+        try:
+            for path, df in tables.items():
+                tmps[path] = f"{path}.{os.getpid()}.part"
+                df.to_csv(tmps[path], index=False)
+            for path, tmp in tmps.items():
+                os.replace(tmp, path)
+                if os.path.exists(journal_path(path)):
+                    os.remove(journal_path(path))
+        finally:
+            for tmp in tmps.values():
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        for path in tables:
+            invalidate(path)
+
+def _read_header(path, columns):
+    """Validate the header of a table once per process and return its columns"""
+    header = _headers.get(path)
+    if header is not None:
+        return header
+
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerow(columns)
+        _headers[path] = list(columns)
+        return _headers[path]
+
+    with open(path, "r", newline="") as f:
+        header = next(csv.reader(f), [])
+    if not header:
+        raise ValueError(f"{path} has an empty header row")
+
+    # A hand-edited file may lack the trailing newline - fix it before appending
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) not in (b"\n", b"\r"):
+            f.write(b"\n")
+
+    _headers[path] = header
+    return header
+
+def _blank(value):
+    if isinstance(value, str):
+        return value == ""
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+def _plain_value(value):
+    """Python int/float/str (or None) for a value headed to SQLite or JSON"""
+    if _blank(value):
+        return None
+    if isinstance(value, np.float32):
+        return float(str(value))  # shortest decimal, not the widened binary value
+    if hasattr(value, "item"):  # numpy scalars
+        value = value.item()
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+def _format_value(value):
+    return "" if _blank(value) else value
+
+def _sync(f, path):
+    """Flush an appended file according to FSYNC_POLICY"""
+    f.flush()
+    if FSYNC_POLICY == "always":
+        os.fsync(f.fileno())
+    elif FSYNC_POLICY == "interval":
+        now = time.monotonic()
+        if now - _last_fsync.get(path, 0.0) >= FSYNC_INTERVAL:
+            os.fsync(f.fileno())
+            _last_fsync[path] = now
+
+def append_row(path, columns, row):
+    """Append a single record to a CSV table without rewriting it.
+
+    `row` is a dict keyed by column name. The record is laid out according to
+    the header actually on disk, so tables whose columns were removed by an
+    admin keep working; missing values are written empty.
+    """
+    append_rows(path, columns, [row])
+
+def append_rows(path, columns, rows):
+    """Append several records in one write (see append_row)"""
+    with _write_lock:
+        header = _read_header(path, columns)
+        with open(path, "a", newline="") as f:
+            csv.writer(f).writerows([_format_value(row.get(col)) for col in header] for row in rows)
+            _sync(f, path)
+        _table_cache.pop(path, None)
+
+# ------------------------------------------------
+# DELETE / UPDATE JOURNAL
+# ------------------------------------------------
+
+def journal_path(path):
+    return f"{path}.journal"
+
+def append_journal(path, entries):
+    """Append {"op": "delete"|"update", "id", "values"} entries for a CSV table;
+    returns the journal size in bytes"""
+    with _write_lock:
+        jpath = journal_path(path)
+        with open(jpath, "a") as f:
+            f.writelines(json.dumps(entry, default=str) + "\n" for entry in entries)
+            _sync(f, jpath)
+        _table_cache.pop(path, None)
+        return os.path.getsize(jpath)
+
+def read_journal(path):
+    """(deleted ids, {id: changed values}) recorded in a table's journal"""
+    deleted, updates = set(), {}
+    try:
+        with open(journal_path(path)) as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return deleted, updates
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:  # torn last line after a crash
+            continue
+        if entry["op"] == "delete":
+            deleted.add(entry["id"])
+            updates.pop(entry["id"], None)
+        elif entry["op"] == "update" and entry["id"] not in deleted:
+            updates.setdefault(entry["id"], {}).update(entry["values"])
+    return deleted, updates
+
+def apply_journal(df, id_col, deleted, updates):
+    """Fold journalled deletes and updates into a freshly read table"""
+    if id_col not in df.columns or not (deleted or updates):
+        return df
+    if deleted:
+        df = df[~df[id_col].isin(deleted)]
+    if updates:
+        df = df.copy()
+        rows = dict(zip(df[id_col], df.index))
+        for record_id, values in updates.items():
+            if record_id in rows:
+                for col, value in values.items():
+                    if col in df.columns:
+                        df.at[rows[record_id], col] = value
+    return df.reset_index(drop=True)
+
+def load_journalled(path, id_col):
+    """Read a CSV table with its journal applied"""
+    return apply_journal(read_table(path), id_col, *read_journal(path))
+
+def compact_table(path, id_col):
+    """Rewrite a CSV table with its journal applied and drop the journal"""
+    with _write_lock:
+        if not os.path.exists(journal_path(path)):
+            return
+        df = load_journalled(path, id_col)
+        tmp = f"{path}.{os.getpid()}.part"
+        df.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+        os.remove(journal_path(path))
+        invalidate(path)
+
+def rewrite_table(path, id_col, change):
+    """Apply change(df) -> df to a CSV table (journal folded in) and write the
+    result in one step, holding the write lock so no concurrent append or
+    journal entry is lost"""
+    with _write_lock:
+        df = change(load_journalled(path, id_col))
+        tmp = f"{path}.{os.getpid()}.part"
+        df.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+        if os.path.exists(journal_path(path)):
+            os.remove(journal_path(path))
+        invalidate(path)
+
+def invalidate(path=None):
+    """Forget cached headers and tables after a table was replaced"""
+    if path is None:
+        _headers.clear()
+        _table_cache.clear()
+    else:
+        _headers.pop(path, None)
+        _table_cache.pop(path, None)
+
+# ------------------------------------------------
+# TABLE CACHE
+# ------------------------------------------------
+
+def file_signature(*paths):
+    """(path, mtime, size) of each file - changes whenever a file is rewritten"""
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append((path, None, None))
+    return tuple(sig)
+
+def cached_table(key, paths, loader):
+    """Return loader() from the shared cache unless one of `paths` changed on disk"""
+    return cached_version(key, file_signature(*paths), loader)
+
+def cached_version(key, version, loader):
+    """Return loader() from the shared cache unless `version` differs from the cached one"""
+    entry = _table_cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    df = loader()
+    _table_cache[key] = (version, df)
+    return df
+
+# ------------------------------------------------
+# STORAGE BACKENDS
+# ------------------------------------------------
+# "csv" keeps users_db.csv / attendance_db.csv as the source of truth,
+# "sqlite" stores both tables in SQLITE_DB (WAL mode, indexed).
+STORAGE_BACKEND = os.getenv("ATTENDANCE_BACKEND", "csv")
+SQLITE_DB = os.getenv("ATTENDANCE_SQLITE_DB", "attendance.sqlite")
+
+TEXT_COLUMNS = ["Record_Id","Name","Roll_No","Organisation","Group","Capture_Date","Capture_Time",
+                "Photo_Location","Upload_Location","Image_File"]
+
+def read_table(path):
+    """Read a CSV table keeping identifiers as strings (roll numbers like 007)"""
+    dtypes = {col: str for col in TEXT_COLUMNS}
+    dtypes["Capture_Ts"] = "Int64"
+    dtypes[USER_ID] = str
+    return pd.read_csv(path, dtype=dtypes)
+
+def new_record_id():
+    return uuid.uuid4().hex
+
+def _as_text(values, index=None):
+    return pd.Series(list(values), index=index, dtype=object).map(lambda v: "" if _blank(v) else str(v))
+
+def capture_timestamps(dates, times):
+    """Epoch seconds (Int64, <NA> if unparseable) of local dates and times in APP_TIMEZONE"""
+    index = dates.index if isinstance(dates, pd.Series) else None
+    dates, times = _as_text(dates, index), _as_text(times, index)
+    local = pd.to_datetime((dates + " " + times).str.strip(), errors="coerce", format="mixed")
+    local = local.dt.tz_localize(APP_TIMEZONE, ambiguous="NaT", nonexistent="NaT")
+    epoch = pd.Series(pd.NA, index=dates.index, dtype="Int64")
+    valid = local.notna() & (dates != "")
+    epoch[valid] = (local[valid] - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    return epoch
+
+def capture_timestamp(date, time):
+    """Epoch seconds of one local capture date/time, or None"""
+    value = capture_timestamps([date], [time]).iloc[0]
+    return None if pd.isna(value) else int(value)
+
+def day_bounds(start=None, end=None):
+    """[lo, hi) epoch range covering the local days start..end (either may be None)"""
+    lo = None if start is None else capture_timestamp(str(start)[:10], "")
+    hi = None if end is None else capture_timestamp(str(end)[:10], "")
+    if hi is not None:
+        hi += 24 * 3600
+    return lo, hi
+
+def _fill_ids(df, id_col):
+    """Copy of `df` with a fresh id wherever `id_col` is missing or blank"""
+    df = df.copy()
+    if id_col not in df.columns:
+        df.insert(0, id_col, pd.Series(dtype=object))
+    blank = df[id_col].map(_blank)
+    df[id_col] = df[id_col].astype(object)
+    df.loc[blank, id_col] = [new_record_id() for _ in range(int(blank.sum()))]
+    return df
+
+def normalize_users(df):
+    """Users frame with User_Id backfilled; returns `df` itself when none was missing"""
+    if USER_ID in df.columns and not df[USER_ID].map(_blank).any():
+        return df
+    return _fill_ids(df, USER_ID)
+
+def normalize_user(row):
+    """Copy of a user row dict with a User_Id"""
+    row = dict(row)
+    if _blank(row.get(USER_ID)):
+        row[USER_ID] = new_record_id()
+    return row
+
+def normalize_row(row):
+    """Copy of an attendance row dict with Record_Id and Capture_Ts filled in"""
+    row = dict(row)
+    if _blank(row.get(RECORD_ID)):
+        row[RECORD_ID] = new_record_id()
+    if _blank(row.get("Capture_Ts")):
+        row["Capture_Ts"] = capture_timestamp(row.get("Capture_Date"), row.get("Capture_Time"))
+    return row
+
+def normalize_attendance(df):
+    """Attendance frame with Record_Id and Capture_Ts backfilled; returns `df`
+    itself when there was nothing to fill"""
+    has_ts = "Capture_Ts" in df.columns
+    todo = df["Capture_Ts"].isna() if has_ts else pd.Series(True, index=df.index)
+    if "Capture_Date" in df.columns:
+        todo &= df["Capture_Date"].notna()
+        fill = capture_timestamps(df.loc[todo, "Capture_Date"],
+                                  df.loc[todo, "Capture_Time"] if "Capture_Time" in df.columns else [""] * int(todo.sum()))
+        fill = fill[fill.notna()]
+    else:
+        fill = pd.Series(dtype="Int64")
+    missing_ids = RECORD_ID not in df.columns or df[RECORD_ID].map(_blank).any()
+    if not missing_ids and has_ts and fill.empty:
+        return df
+
+    df = _fill_ids(df, RECORD_ID)
+    if not has_ts:
+        at = df.columns.get_loc("Capture_Time") + 1 if "Capture_Time" in df.columns else len(df.columns)
+        df.insert(at, "Capture_Ts", pd.Series(pd.NA, index=df.index, dtype="Int64"))
+    df["Capture_Ts"] = df["Capture_Ts"].astype("Int64")
+    df.loc[fill.index, "Capture_Ts"] = fill
+    return df
+
+# The cached attendance frame is shared by every session, so it is kept
+# compact: repeated strings are categoricals, coordinates float32 and the
+# timestamp a nullable int64.
+CATEGORY_COLUMNS = ["Group", "Name", "Roll_No", "Capture_Date", "Photo_Location", "Upload_Location"]
+FLOAT32_COLUMNS = ["Latitude", "Longitude"]
+
+def compact_attendance(df):
+    """Convert a freshly loaded attendance frame to its compact dtypes (in place)"""
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+    if "Capture_Ts" in df.columns:
+        df["Capture_Ts"] = pd.to_numeric(df["Capture_Ts"], errors="coerce").astype("Int64")
+    return df
+
+def build_ts_index(att):
+    """(sorted epoch array, row positions) for binary-search range queries;
+    rows without a timestamp are left out"""
+    if "Capture_Ts" not in att.columns:
+        return np.empty(0, dtype="int64"), np.empty(0, dtype="int64")
+    ts = att["Capture_Ts"].astype("Int64")
+    positions = np.flatnonzero(ts.notna().to_numpy())
+    values = ts.to_numpy(dtype="float64", na_value=np.nan)[positions].astype("int64")
+    order = np.argsort(values, kind="stable")
+    return values[order], positions[order]
+
+def _with_timestamp(current, values):
+    """Update values plus the matching Capture_Ts when the date or time changes"""
+    values = {col: _plain_value(v) for col, v in dict(values).items()}
+    if ("Capture_Date" in values or "Capture_Time" in values) and "Capture_Ts" not in values:
+        values["Capture_Ts"] = capture_timestamp(values.get("Capture_Date", current.get("Capture_Date")),
+                                                 values.get("Capture_Time", current.get("Capture_Time")))
+    return values
+
+# ------------------------------------------------
+# BULK OPERATIONS
+# ------------------------------------------------
+# Admin bulk edits select rows with the same filters on both backends: group,
+# local date range, intern (Roll_No) and/or missing GPS.
+
+def has_filters(group=None, start=None, end=None, roll=None, missing_gps=False):
+    return bool(group or start is not None or end is not None or roll or missing_gps)
+
+def attendance_mask(df, group=None, start=None, end=None, roll=None, missing_gps=False):
+    """Boolean mask of the attendance rows matching the bulk filters"""
+    mask = pd.Series(True, index=df.index)
+    if group:
+        mask &= df["Group"] == group
+    if roll:
+        mask &= df["Roll_No"] == roll
+    if start is not None or end is not None:
+        lo, hi = day_bounds(start, end)
+        ts = df["Capture_Ts"] if "Capture_Ts" in df.columns else pd.Series(pd.NA, index=df.index, dtype="Int64")
+        if lo is not None:
+            mask &= (ts >= lo).fillna(False)
+        if hi is not None:
+            mask &= (ts < hi).fillna(False)
+    if missing_gps:
+        lat = pd.to_numeric(df["Latitude"], errors="coerce") if "Latitude" in df.columns else pd.Series(np.nan, index=df.index)
+        lon = pd.to_numeric(df["Longitude"], errors="coerce") if "Longitude" in df.columns else pd.Series(np.nan, index=df.index)
+        mask &= lat.isna() | lon.isna() | ((lat == 0) & (lon == 0))
+    return mask.astype(bool)
+
+def _bulk_values(df, values):
+    """Values for a bulk update of `df`'s rows; a new date or time also yields
+    the recomputed Capture_Ts per row"""
+    values = {col: _plain_value(v) for col, v in dict(values).items()}
+    if "Capture_Date" in values or "Capture_Time" in values:
+        # A date or time column the admin removed reads as blank
+        current = {col: df[col] if col in df.columns else [""] * len(df) for col in ("Capture_Date", "Capture_Time")}
+        dates = [values["Capture_Date"]] * len(df) if "Capture_Date" in values else current["Capture_Date"]
+        times = [values["Capture_Time"]] * len(df) if "Capture_Time" in values else current["Capture_Time"]
+        values["Capture_Ts"] = capture_timestamps(pd.Series(list(dates), index=df.index), times)
+    return values
+
+# Columns the admin attendance grid can sort by
+SORT_COLUMNS = ["Capture_Date", "Group", "Name", "Roll_No"]
+
+def _page_sort(sort):
+    """ORDER BY columns for a page query; date sorts break ties by time"""
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {sort!r}")
+    return ["Capture_Ts", "Capture_Date", "Capture_Time"] if sort == "Capture_Date" else [sort]
+
+
+class CsvBackend:
+    """Users and attendance kept in two CSV files"""
+
+    kind = "csv"
+
+    def __init__(self, users_path, attend_path):
+        self.users_path = users_path
+        self.attend_path = attend_path
+        ensure_table(users_path, USERS_COLUMNS)
+        ensure_table(attend_path, ATTEND_COLUMNS)
+        # Backfill ids / Capture_Ts for tables written by older versions
+        users = self.load_users()
+        if normalize_users(users) is not users:
+            rewrite_table(users_path, USER_ID, normalize_users)
+        att = self.load_attendance()
+        if normalize_attendance(att) is not att:
+            rewrite_table(attend_path, RECORD_ID, normalize_attendance)
+
+    # ---------- whole tables ----------
+    def load_users(self):
+        return cached_table(self.users_path, [self.users_path, journal_path(self.users_path)],
+                            lambda: load_journalled(self.users_path, USER_ID))
+
+    def load_attendance(self):
+        return cached_table(self.attend_path, [self.attend_path, journal_path(self.attend_path)],
+                            lambda: compact_attendance(load_journalled(self.attend_path, RECORD_ID)))
+
+    def version(self, table):
+        """Changes whenever the given table ("users" or "attendance") changes"""
+        path = self.users_path if table == "users" else self.attend_path
+        return file_signature(path, journal_path(path))
+
+    def replace_users(self, df):
+        write_table(self.users_path, normalize_users(df))
+
+    def replace_attendance(self, df):
+        write_table(self.attend_path, normalize_attendance(df))
+
+    def replace_all(self, users, attendance):
+        write_tables({self.users_path: normalize_users(users), self.attend_path: normalize_attendance(attendance)})
+
+    def _journal(self, path, id_col, entries):
+        if entries and append_journal(path, entries) >= JOURNAL_COMPACT_BYTES:
+            compact_table(path, id_col)
+
+    def compact(self):
+        """Fold both journals into their tables"""
+        compact_table(self.users_path, USER_ID)
+        compact_table(self.attend_path, RECORD_ID)
+
+    def reset(self):
+        self.replace_all(pd.DataFrame(columns=USERS_COLUMNS), pd.DataFrame(columns=ATTEND_COLUMNS))
+
+    # ---------- users ----------
+    def groups(self):
+        return self.load_users()["Group"].dropna().unique().tolist()
+
+    def count_in_group(self, group):
+        users = self.load_users()
+        return int((users["Group"] == group).sum())
+
+    def rename_group(self, old, new):
+        rewrite_table(self.users_path, USER_ID, lambda users: users.assign(Group=users["Group"].replace(old, new)))
+
+    def delete_group(self, group):
+        rewrite_table(self.users_path, USER_ID, lambda users: users[users["Group"] != group])
+
+    def append_user(self, row):
+        append_row(self.users_path, USERS_COLUMNS, normalize_user(row))
+
+    def append_users(self, rows):
+        append_rows(self.users_path, USERS_COLUMNS, [normalize_user(row) for row in rows])
+
+    def delete_users(self, user_ids):
+        """Delete users by User_Id; returns the deleted rows"""
+        users = self.load_users()
+        removed = users[users[USER_ID].isin(list(user_ids))]
+        self._journal(self.users_path, USER_ID, [{"op": "delete", "id": uid} for uid in removed[USER_ID]])
+        return removed
+
+    # ---------- attendance ----------
+    def append_attendance(self, row):
+        """Append one record; returns its Record_Id"""
+        row = normalize_row(row)
+        append_row(self.attend_path, ATTEND_COLUMNS, row)
+        return row[RECORD_ID]
+
+    def _ts_index(self):
+        return cached_table((self.attend_path, "ts_index"), [self.attend_path, journal_path(self.attend_path)],
+                            lambda: build_ts_index(self.load_attendance()))
+
+    def _between(self, start=None, end=None):
+        """Rows captured on local days start..end, found by binary search on Capture_Ts"""
+        att = self.load_attendance()
+        if start is None and end is None:
+            return att
+        lo, hi = day_bounds(start, end)
+        values, positions = self._ts_index()
+        i = 0 if lo is None else np.searchsorted(values, lo, side="left")
+        j = len(values) if hi is None else np.searchsorted(values, hi, side="left")
+        return att.iloc[np.sort(positions[i:j])]
+
+    def attendance_between(self, start=None, end=None, group=None):
+        """Attendance captured on local days start..end, optionally for one group"""
+        att = self._between(start, end)
+        return att[att["Group"] == group] if group else att
+
+    def query_attendance(self, group=None, name=None, roll=None, start=None, end=None,
+                         sort="Capture_Date", descending=True, limit=50, offset=0):
+        """One page of attendance matching the filters, plus the total match count"""
+        att = self._between(start, end)
+        mask = pd.Series(True, index=att.index)
+        if group:
+            mask &= att["Group"] == group
+        if name:
+            mask &= att["Name"].str.contains(name, case=False, regex=False, na=False)
+        if roll:
+            mask &= att["Roll_No"] == roll
+        matched = att[mask]
+        order = [c for c in _page_sort(sort) if c in matched.columns]
+        if order and limit:
+            matched = matched.sort_values(order, ascending=not descending, kind="stable", na_position="last")
+        return matched.iloc[offset:offset + limit], len(matched)
+
+    def delete_attendance(self, record_ids):
+        """Delete records by Record_Id; returns the deleted rows"""
+        att = self.load_attendance()
+        removed = att[att[RECORD_ID].isin(list(record_ids))]
+        self._journal(self.attend_path, RECORD_ID, [{"op": "delete", "id": rid} for rid in removed[RECORD_ID]])
+        return removed
+
+    def match_attendance(self, **filters):
+        """Rows a bulk operation with these filters would touch (the dry run)"""
+        att = self.load_attendance()
+        return att[attendance_mask(att, **filters)]
+
+    def delete_matching(self, **filters):
+        """Delete every record matching the filters in one write; returns them"""
+        removed = []
+
+        def change(att):
+            mask = attendance_mask(att, **filters)
+            removed.append(att[mask])
+            return att[~mask]
+
+        rewrite_table(self.attend_path, RECORD_ID, change)
+        return removed[0]
+
+    def update_matching(self, values, **filters):
+        """Set `values` on every record matching the filters in one write; returns the count"""
+        counts = []
+
+        def change(att):
+            mask = attendance_mask(att, **filters)
+            counts.append(int(mask.sum()))
+            for col, value in _bulk_values(att[mask], values).items():
+                if col not in att.columns:
+                    continue
+                if col == "Capture_Ts":
+                    att[col] = att[col].astype("Int64")
+                elif not isinstance(value, pd.Series):
+                    att[col] = att[col].astype(object)
+                att.loc[mask, col] = value
+            return att
+
+        rewrite_table(self.attend_path, RECORD_ID, change)
+        return counts[0]
+
+    def update_attendance(self, record_id, values):
+        """Change fields of one record; returns False if there is no such record"""
+        att = self.load_attendance()
+        match = att[att[RECORD_ID] == record_id]
+        if match.empty:
+            return False
+        values = _with_timestamp(match.iloc[0], values)
+        self._journal(self.attend_path, RECORD_ID, [{"op": "update", "id": record_id, "values": values}])
+        return True
+
+    def remap_attendance(self, column, mapping):
+        """Replace values of one column ({old: new}) in one write; returns the rows changed"""
+        counts = []
+
+        def change(att):
+            hit = att[column].isin(list(mapping)) if column in att.columns else pd.Series(False, index=att.index)
+            counts.append(int(hit.sum()))
+            if counts[0]:
+                att[column] = att[column].replace(mapping)
+            return att
+
+        rewrite_table(self.attend_path, RECORD_ID, change)
+        return counts[0]
+
+    def drop_attendance_column(self, column):
+        """Remove a column from every record; returns False if there is no such column"""
+        found = []
+
+        def change(att):
+            found.append(column in att.columns)
+            return att.drop(columns=[column]) if found[0] else att
+
+        rewrite_table(self.attend_path, RECORD_ID, change)
+        return found[0]
+
+    # ---------- statistics ----------
+    def count_users(self):
+        return len(self.load_users())
+
+    def count_attendance(self):
+        return len(self.load_attendance())
+
+    def count_groups(self):
+        return len(self.groups())
+
+
+class SqliteBackend:
+    """Users and attendance stored in one SQLite database in WAL mode.
+
+    Every write stores a fresh token for the table it changed in
+    "table_versions", in the same transaction, so a submit does not
+    invalidate what is cached for the users table.
+    """
+
+    kind = "sqlite"
+
+    INDEXES = {
+        "users": [("idx_users_group_name", ["Group", "Name"]), ("idx_users_id", ["User_Id"])],
+        "attendance": [
+            ("idx_att_roll_ts", ["Roll_No", "Capture_Ts"]),
+            ("idx_att_ts", ["Capture_Ts"]),
+            ("idx_att_group_ts", ["Group", "Capture_Ts"]),
+            ("idx_att_record", ["Record_Id"]),
+        ],
+    }
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._columns = {}
+        with self._con() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version TEXT)")
+        for table, columns in (("users", USERS_COLUMNS), ("attendance", ATTEND_COLUMNS)):
+            if not self._table_columns(table):
+                self._replace((table, pd.DataFrame(columns=columns)))
+        # Backfill ids / Capture_Ts for databases written by older versions
+        users = self.load_users()
+        if normalize_users(users) is not users:
+            self._rewrite("users", normalize_users)
+        att = self.load_attendance()
+        if normalize_attendance(att) is not att:
+            self._rewrite("attendance", normalize_attendance)
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.db_path, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _table_columns(self, table):
+        if table not in self._columns:
+            rows = self._con().execute(f'PRAGMA table_info("{table}")').fetchall()
+            if not rows:
+                return []
+            self._columns[table] = [r[1] for r in rows]
+        return self._columns[table]
+
+    def _create(self, con, table, columns):
+        """Drop and recreate a table with its indexes (caller owns the transaction)"""
+        types = {"Latitude": "REAL", "Longitude": "REAL", "Capture_Ts": "INTEGER"}
+        cols = ", ".join(f'"{c}" {types.get(c, "TEXT")}' for c in columns)
+        con.execute(f'DROP TABLE IF EXISTS "{table}"')
+        con.execute(f'CREATE TABLE "{table}" ({cols})')
+        for name, index_cols in self.INDEXES[table]:
+            if all(c in columns for c in index_cols):
+                quoted = ", ".join(f'"{c}"' for c in index_cols)
+                con.execute(f'CREATE INDEX "{name}" ON "{table}" ({quoted})')
+
+    def _insert_sql(self, table, columns):
+        quoted = ", ".join(f'"{c}"' for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        return f'INSERT INTO "{table}" ({quoted}) VALUES ({marks})'
+
+    def _insert(self, table, rows):
+        columns = self._table_columns(table)
+        values = [[self._value(row.get(c)) for c in columns] for row in rows]
+        self._execute(table, self._insert_sql(table, columns), values, many=True)
+
+    @staticmethod
+    def _touch(con, table):
+        """Give `table` a new version (caller owns the transaction)"""
+        con.execute("INSERT OR REPLACE INTO table_versions (name, version) VALUES (?, ?)", (table, new_record_id()))
+
+    def _execute(self, table, sql, params=(), many=False):
+        """Run a write statement against `table` and drop its cached copy"""
+        con = self._con()
+        with con:
+            if many:
+                con.executemany(sql, params)
+            else:
+                con.execute(sql, params)
+            self._touch(con, table)
+        _table_cache.pop((self.db_path, table), None)
+
+    _value = staticmethod(_plain_value)
+
+    def _query(self, sql, params=()):
+        return pd.read_sql_query(sql, self._con(), params=params)
+
+    def _fill(self, con, table, df):
+        """Recreate `table` holding exactly `df` (caller owns the transaction)"""
+        columns = list(df.columns)
+        values = [[self._value(v) for v in row] for row in df.itertuples(index=False, name=None)]
+        self._create(con, table, columns)
+        con.executemany(self._insert_sql(table, columns), values)
+
+    def _replace(self, *tables):
+        """Swap the contents (and columns) of (table, df) pairs in a single transaction"""
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            for table, df in tables:
+                self._fill(con, table, df)
+                self._touch(con, table)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        for table, df in tables:
+            self._columns[table] = list(df.columns)
+            _table_cache.pop((self.db_path, table), None)
+
+    def _rewrite(self, table, change):
+        """Replace `table` with change(current contents), read and written in one transaction"""
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            df = change(self._query(f'SELECT * FROM "{table}" ORDER BY rowid'))
+            self._fill(con, table, df)
+            self._touch(con, table)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        self._columns[table] = list(df.columns)
+        _table_cache.pop((self.db_path, table), None)
+
+    # ---------- whole tables ----------
+    def _load(self, table):
+        def load():
+            df = self._query(f'SELECT * FROM "{table}" ORDER BY rowid')
+            return compact_attendance(df) if table == "attendance" else df
+
+        return cached_version((self.db_path, table), self.version(table), load)
+
+    def load_users(self):
+        return self._load("users")
+
+    def load_attendance(self):
+        return self._load("attendance")
+
+    def version(self, table):
+        """Changes whenever the given table ("users" or "attendance") changes"""
+        row = self._con().execute("SELECT version FROM table_versions WHERE name = ?", (table,)).fetchone()
+        return self.db_path, row[0] if row else None
+
+    def replace_users(self, df):
+        self._replace(("users", normalize_users(df)))
+
+    def replace_attendance(self, df):
+        self._replace(("attendance", normalize_attendance(df)))
+
+    def replace_all(self, users, attendance):
+        self._replace(("users", normalize_users(users)), ("attendance", normalize_attendance(attendance)))
+
+    def reset(self):
+        self.replace_all(pd.DataFrame(columns=USERS_COLUMNS), pd.DataFrame(columns=ATTEND_COLUMNS))
+
+    # ---------- users ----------
+    def groups(self):
+        rows = self._con().execute(
+            'SELECT "Group" FROM "users" WHERE "Group" IS NOT NULL GROUP BY "Group" ORDER BY MIN(rowid)'
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def count_in_group(self, group):
+        return self._con().execute('SELECT COUNT(*) FROM "users" WHERE "Group" = ?', (group,)).fetchone()[0]
+
+    def rename_group(self, old, new):
+        self._execute("users", 'UPDATE "users" SET "Group" = ? WHERE "Group" = ?', (new, old))
+
+    def delete_group(self, group):
+        self._execute("users", 'DELETE FROM "users" WHERE "Group" = ?', (group,))
+
+    def append_user(self, row):
+        self._insert("users", [normalize_user(row)])
+
+    def append_users(self, rows):
+        self._insert("users", [normalize_user(row) for row in rows])
+
+    def _delete(self, table, id_col, ids):
+        ids = list(ids)
+        if not ids:
+            return self._query(f'SELECT * FROM "{table}" LIMIT 0')
+        marks = ", ".join("?" for _ in ids)
+        removed = self._query(f'SELECT * FROM "{table}" WHERE "{id_col}" IN ({marks})', ids)
+        self._execute(table, f'DELETE FROM "{table}" WHERE "{id_col}" IN ({marks})', ids)
+        return removed
+
+    def _update(self, table, id_col, record_id, values):
+        columns = self._table_columns(table)
+        values = {col: v for col, v in values.items() if col in columns}
+        if not values:
+            return self._con().execute(f'SELECT 1 FROM "{table}" WHERE "{id_col}" = ?', (record_id,)).fetchone() is not None
+        assignments = ", ".join(f'"{col}" = ?' for col in values)
+        con = self._con()
+        with con:
+            cur = con.execute(f'UPDATE "{table}" SET {assignments} WHERE "{id_col}" = ?',
+                              [self._value(v) for v in values.values()] + [record_id])
+            self._touch(con, table)
+        _table_cache.pop((self.db_path, table), None)
+        return cur.rowcount > 0
+
+    def delete_users(self, user_ids):
+        """Delete users by User_Id; returns the deleted rows"""
+        return self._delete("users", USER_ID, user_ids)
+
+    # ---------- attendance ----------
+    def append_attendance(self, row):
+        """Append one record; returns its Record_Id"""
+        row = normalize_row(row)
+        self._insert("attendance", [row])
+        return row[RECORD_ID]
+
+    @staticmethod
+    def _range_clauses(start, end, clauses, params):
+        lo, hi = day_bounds(start, end)
+        if lo is not None:
+            clauses.append('"Capture_Ts" >= ?')
+            params.append(lo)
+        if hi is not None:
+            clauses.append('"Capture_Ts" < ?')
+            params.append(hi)
+
+    def attendance_between(self, start=None, end=None, group=None):
+        """Attendance captured on local days start..end, optionally for one group"""
+        clauses, params = [], []
+        if group:
+            clauses.append('"Group" = ?')
+            params.append(group)
+        self._range_clauses(start, end, clauses, params)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._query(f'SELECT * FROM "attendance"{where} ORDER BY rowid', params)
+
+    def query_attendance(self, group=None, name=None, roll=None, start=None, end=None,
+                         sort="Capture_Date", descending=True, limit=50, offset=0):
+        """One page of attendance matching the filters, plus the total match count"""
+        clauses, params = [], []
+        if group:
+            clauses.append('"Group" = ?')
+            params.append(group)
+        if name:
+            clauses.append("instr(lower(\"Name\"), lower(?)) > 0")
+            params.append(name)
+        if roll:
+            clauses.append('"Roll_No" = ?')
+            params.append(roll)
+        self._range_clauses(start, end, clauses, params)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        total = self._con().execute(f'SELECT COUNT(*) FROM "attendance"{where}', params).fetchone()[0]
+
+        columns = self._table_columns("attendance")
+        direction = "DESC" if descending else "ASC"
+        order = [f'"{c}" IS NULL, "{c}" {direction}' for c in _page_sort(sort) if c in columns]
+        order_by = ", ".join(order + [f"rowid {direction}"])
+        page = self._query(f'SELECT * FROM "attendance"{where} ORDER BY {order_by} LIMIT ? OFFSET ?',
+                           params + [int(limit), int(offset)])
+        return page, total
+
+    def delete_attendance(self, record_ids):
+        """Delete records by Record_Id; returns the deleted rows"""
+        return self._delete("attendance", RECORD_ID, record_ids)
+
+    def update_attendance(self, record_id, values):
+        """Change fields of one record; returns False if there is no such record"""
+        current = self._query('SELECT * FROM "attendance" WHERE "Record_Id" = ?', (record_id,))
+        if current.empty:
+            return False
+        return self._update("attendance", RECORD_ID, record_id, _with_timestamp(current.iloc[0], values))
+
+    def remap_attendance(self, column, mapping):
+        """Replace values of one column ({old: new}) in one write; returns the rows changed"""
+        if column not in self._table_columns("attendance"):
+            return 0
+        con = self._con()
+        with con:
+            changed = sum(con.execute(f'UPDATE "attendance" SET "{column}" = ? WHERE "{column}" = ?',
+                                      (self._value(new), self._value(old))).rowcount
+                          for old, new in mapping.items())
+            self._touch(con, "attendance")
+        _table_cache.pop((self.db_path, "attendance"), None)
+        return changed
+
+    def drop_attendance_column(self, column):
+        """Remove a column from every record; returns False if there is no such column"""
+        if column not in self._table_columns("attendance"):
+            return False
+        self._rewrite("attendance", lambda att: att.drop(columns=[column]))
+        return True
+
+    def _bulk_where(self, group=None, start=None, end=None, roll=None, missing_gps=False):
+        clauses, params = [], []
+        if group:
+            clauses.append('"Group" = ?')
+            params.append(group)
+        if roll:
+            clauses.append('"Roll_No" = ?')
+            params.append(roll)
+        self._range_clauses(start, end, clauses, params)
+        if missing_gps:
+            clauses.append('("Latitude" IS NULL OR "Longitude" IS NULL OR ("Latitude" = 0 AND "Longitude" = 0))')
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def match_attendance(self, **filters):
+        """Rows a bulk operation with these filters would touch (the dry run)"""
+        where, params = self._bulk_where(**filters)
+        return compact_attendance(self._query(f'SELECT * FROM "attendance"{where} ORDER BY rowid', params))
+
+    def delete_matching(self, **filters):
+        """Delete every record matching the filters in one transaction; returns them"""
+        where, params = self._bulk_where(**filters)
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            removed = self._query(f'SELECT * FROM "attendance"{where} ORDER BY rowid', params)
+            con.execute(f'DELETE FROM "attendance"{where}', params)
+            self._touch(con, "attendance")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        _table_cache.pop((self.db_path, "attendance"), None)
+        return removed
+
+    def update_matching(self, values, **filters):
+        """Set `values` on every record matching the filters in one transaction; returns the count"""
+        where, params = self._bulk_where(**filters)
+        columns = self._table_columns("attendance")
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            selected = ", ".join(f'"{col}"' for col in (RECORD_ID, "Capture_Date", "Capture_Time") if col in columns)
+            rows = self._query(f'SELECT {selected} FROM "attendance"{where}', params)
+            values = {col: v for col, v in _bulk_values(rows, values).items() if col in columns}
+            fixed = {col: v for col, v in values.items() if not isinstance(v, pd.Series)}
+            if fixed:
+                assignments = ", ".join(f'"{col}" = ?' for col in fixed)
+                con.execute(f'UPDATE "attendance" SET {assignments}{where}', list(fixed.values()) + params)
+            for col, series in values.items():
+                if isinstance(series, pd.Series):
+                    con.executemany(f'UPDATE "attendance" SET "{col}" = ? WHERE "Record_Id" = ?',
+                                    zip(map(self._value, series), rows["Record_Id"]))
+            self._touch(con, "attendance")
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        _table_cache.pop((self.db_path, "attendance"), None)
+        return len(rows)
+
+    def compact(self):
+        """Nothing to fold: SQLite deletes and updates rows in place"""
+
+    # ---------- statistics ----------
+    def count_users(self):
+        return self._con().execute('SELECT COUNT(*) FROM "users"').fetchone()[0]
+
+    def count_attendance(self):
+        return self._con().execute('SELECT COUNT(*) FROM "attendance"').fetchone()[0]
+
+    def count_groups(self):
+        return self._con().execute(
+            'SELECT COUNT(DISTINCT "Group") FROM "users" WHERE "Group" IS NOT NULL'
+        ).fetchone()[0]
+
+
+def open_backend(users_path, attend_path, kind=None, db_path=None):
+    """Return the storage backend selected by ATTENDANCE_BACKEND"""
+    kind = kind or STORAGE_BACKEND
+    if kind == "csv":
+        return CsvBackend(users_path, attend_path)
+    if kind == "sqlite":
+        return SqliteBackend(db_path or SQLITE_DB)
+    raise ValueError(f"Unknown storage backend '{kind}' (expected 'csv' or 'sqlite')")
+
+def migrate_csv_to_sqlite(users_path, attend_path, db_path, force=False):
+    """One-shot import of the CSV tables into a SQLite database"""
+    backend = SqliteBackend(db_path)
+    if not force and (backend.count_users() or backend.count_attendance()):
+        raise RuntimeError(f"{db_path} already contains data; pass force=True to overwrite it")
+    users = load_journalled(users_path, USER_ID) if os.path.exists(users_path) else pd.DataFrame(columns=USERS_COLUMNS)
+    att = load_journalled(attend_path, RECORD_ID) if os.path.exists(attend_path) else pd.DataFrame(columns=ATTEND_COLUMNS)
+    backend.replace_all(users, att)
+    return len(users), len(att)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Attendance storage utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="import users_db.csv / attendance_db.csv into SQLite")
+    mig.add_argument("--users", default="users_db.csv")
+    mig.add_argument("--attendance", default="attendance_db.csv")
+    mig.add_argument("--db", default=SQLITE_DB)
+    mig.add_argument("--force", action="store_true", help="overwrite a non-empty database")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        n_users, n_att = migrate_csv_to_sqlite(args.users, args.attendance, args.db, force=args.force)
+        print(f"Imported {n_users} users and {n_att} attendance records into {args.db}")
@@ -0,0 +1,162 @@
+import hashlib
+import time
+
+import pytest
+
+import drive_sync
+
+
+class FakeDrive:
+    """Drive client double: fails the first `failures` uploads, then succeeds"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.uploads = []
+
+    def upload(self, local_path, title):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Drive unavailable")
+        with open(local_path, "rb") as f:
+            self.uploads.append((title, hashlib.md5(f.read()).hexdigest()))
+        return f"drive-{len(self.uploads)}"
+
+    def list_files(self):
+        return [{"title": title, "md5Checksum": md5, "fileSize": None} for title, md5 in self.uploads]
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(b"\xff\xd8 not really a jpeg")
+    return str(path)
+
+@pytest.fixture
+def manifest(tmp_path):
+    return str(tmp_path / "drive_manifest.json")
+
+@pytest.fixture
+def queue(tmp_path):
+    return drive_sync.UploadQueue(str(tmp_path / "queue.sqlite"))
+
+def job_row(queue, job_id):
+    return queue._con.execute(
+        "SELECT status, attempts, next_attempt, last_error, drive_id FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+
+def run_next(queue, client, manifest):
+    job = queue.claim()
+    assert job is not None
+    drive_sync.run_job(queue, client, job, manifest)
+    return job[0]
+
+
+def test_upload_succeeds_and_is_recorded_in_manifest(queue, photo, manifest):
+    job_id = queue.enqueue(photo, "Asha_R1_20240301_091500.jpg")
+    client = FakeDrive()
+
+    run_next(queue, client, manifest)
+
+    status, attempts, _, error, drive_id = job_row(queue, job_id)
+    assert (status, attempts, error, drive_id) == ("done", 0, None, "drive-1")
+    assert client.uploads[0][0] == "Asha_R1_20240301_091500.jpg"
+    assert drive_sync.load_manifest(manifest)["remote"] == [client.uploads[0][1]]
+    assert queue.claim() is None
+
+def test_failed_upload_is_retried_with_backoff(queue, photo, manifest):
+    job_id = queue.enqueue(photo, "photo.jpg")
+    client = FakeDrive(failures=2)
+
+    before = time.time()
+    run_next(queue, client, manifest)
+    status, attempts, next_attempt, error, _ = job_row(queue, job_id)
+    assert (status, attempts) == ("pending", 1)
+    assert "Drive unavailable" in error
+    first_delay = next_attempt - before
+    assert drive_sync.BACKOFF_BASE * 0.8 <= first_delay <= drive_sync.BACKOFF_BASE * 1.2 + 1
+    assert queue.claim() is None  # not due yet
+
+    queue._con.execute("UPDATE jobs SET next_attempt = 0 WHERE id = ?", (job_id,))
+    before = time.time()
+    run_next(queue, client, manifest)
+    status, attempts, next_attempt, _, _ = job_row(queue, job_id)
+    assert (status, attempts) == ("pending", 2)
+    assert next_attempt - before >= drive_sync.BACKOFF_BASE * 2 * 0.8
+
+    queue._con.execute("UPDATE jobs SET next_attempt = 0 WHERE id = ?", (job_id,))
+    run_next(queue, client, manifest)
+    assert job_row(queue, job_id)[0] == "done"
+    assert len(client.uploads) == 1
+
+def test_job_fails_after_max_attempts_and_can_be_retried(queue, photo, manifest, monkeypatch):
+    monkeypatch.setattr(drive_sync, "MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(drive_sync, "BACKOFF_BASE", 0.0)
+    job_id = queue.enqueue(photo, "photo.jpg")
+    client = FakeDrive(failures=3)
+
+    for _ in range(3):
+        run_next(queue, client, manifest)
+    status, attempts, _, error, _ = job_row(queue, job_id)
+    assert (status, attempts) == ("failed", 3)
+    assert "Drive unavailable" in error
+    assert queue.claim() is None
+    assert queue.counts() == {"failed": 1}
+
+    assert queue.retry_failed() == 1
+    assert job_row(queue, job_id)[:2] == ("pending", 0)
+    run_next(queue, client, manifest)
+    assert job_row(queue, job_id)[0] == "done"
+    assert queue.retry_failed() == 0
+
+def test_running_jobs_resume_after_restart(tmp_path, photo, manifest):
+    path = str(tmp_path / "queue.sqlite")
+    queue = drive_sync.UploadQueue(path)
+    job_id = queue.enqueue(photo, "photo.jpg")
+    assert queue.claim()[0] == job_id
+    assert queue.counts() == {"running": 1}
+
+    restarted = drive_sync.UploadQueue(path)
+    assert restarted.counts() == {"pending": 1}
+    run_next(restarted, FakeDrive(), manifest)
+    assert restarted.counts() == {"done": 1}
+
+def test_missing_client_counts_as_failed_attempt(queue, photo, manifest):
+    job_id = queue.enqueue(photo, "photo.jpg")
+    run_next(queue, None, manifest)
+    status, attempts, _, error, _ = job_row(queue, job_id)
+    assert (status, attempts, error) == ("pending", 1, "Google Drive not configured")
+
+def test_workers_drain_queue(queue, tmp_path, manifest):
+    client = FakeDrive(failures=1)
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"photo{i}.jpg"
+        path.write_bytes(bytes([i]) * 100)
+        paths.append(str(path))
+    drive_sync.start_workers(queue, lambda: client, workers=2, manifest_path=manifest)
+    for i, path in enumerate(paths):
+        queue.enqueue(path, f"photo{i}.jpg")
+
+    deadline = time.time() + 10
+    while queue.counts().get("done", 0) < 4 and time.time() < deadline:
+        time.sleep(0.05)
+
+    counts = queue.counts()
+    # One upload failed once and waits for its backoff; the rest are done
+    assert counts == {"done": 4, "pending": 1}
+    assert len(drive_sync.load_manifest(manifest)["remote"]) == 4
+
+def test_sync_skips_listing_after_queued_uploads(queue, tmp_path, manifest):
+    uploads = tmp_path / "uploads"
+    (uploads / "ab").mkdir(parents=True)
+    photo = uploads / "ab" / "photo.jpg"
+    photo.write_bytes(b"queued photo")
+    client = FakeDrive()
+    client.list_files = lambda: pytest.fail("Drive folder was listed")
+
+    queue.enqueue(str(photo), "photo.jpg")
+    run_next(queue, client, manifest)
+    summary = drive_sync.sync_uploads(str(uploads), client, manifest)
+
+    assert summary["uploaded"] == 0 and summary["errors"] == {}
+    assert len(client.uploads) == 1
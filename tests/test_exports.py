@@ -0,0 +1,90 @@
+import zipfile
+
+import pytest
+from openpyxl import load_workbook
+
+import exports
+import storage
+
+
+def test_excel_export_with_unparseable_capture_date(tmp_path):
+    db = storage.CsvBackend(str(tmp_path / "users.csv"), str(tmp_path / "attendance.csv"))
+    db.append_attendance({"Group": "G1", "Name": "Asha", "Roll_No": "R1",
+                          "Capture_Date": "2024-03-01", "Capture_Time": "09:15:00",
+                          "Latitude": 23.1, "Longitude": 72.6, "Image_File": "a.jpg"})
+    # Cameras without a clock write EXIF "0000:00:00 00:00:00"
+    db.append_attendance({"Group": "G1", "Name": "Ravi", "Roll_No": "R2",
+                          "Capture_Date": "0000-00-00", "Capture_Time": "00:00:00", "Image_File": "b.jpg"})
+    assert db.load_attendance()["Capture_Ts"].isna().sum() == 1
+
+    path = exports.attendance_excel(db, str(tmp_path / "exports"))
+
+    rows = list(load_workbook(path, read_only=True).active.values)
+    header = rows[0]
+    by_name = {row[header.index("Name")]: row for row in rows[1:]}
+    assert by_name["Ravi"][header.index("Capture_Ts")] is None
+    assert by_name["Ravi"][header.index("Latitude")] is None
+    assert by_name["Asha"][header.index("Capture_Ts")] == storage.capture_timestamp("2024-03-01", "09:15:00")
+
+def test_excel_export_keeps_float32_coordinates_short(tmp_path):
+    db = storage.CsvBackend(str(tmp_path / "users.csv"), str(tmp_path / "attendance.csv"))
+    db.append_attendance({"Group": "G1", "Name": "Asha", "Roll_No": "R1", "Capture_Date": "2024-03-01",
+                          "Capture_Time": "09:15:00", "Latitude": 23.1, "Longitude": 72.6817})
+    assert db.load_attendance()["Latitude"].dtype == "float32"
+
+    path = exports.attendance_excel(db, str(tmp_path / "exports"))
+
+    header, row = list(load_workbook(path, read_only=True).active.values)
+    assert row[header.index("Latitude")] == 23.1
+    assert row[header.index("Longitude")] == 72.6817
+
+
+def tampered_copy(path, dest, change):
+    """Copy of backup ZIP `path` with `change(name, data)` applied to each member (None drops it)"""
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(dest, "w") as out:
+        for info in src.infolist():
+            data = change(info.filename, src.read(info))
+            if data is not None:
+                out.writestr(info, data)
+    return str(dest)
+
+@pytest.fixture
+def backup(tmp_path):
+    db = storage.CsvBackend(str(tmp_path / "users.csv"), str(tmp_path / "attendance.csv"))
+    db.append_attendance({"Group": "G1", "Name": "Asha", "Roll_No": "R1", "Capture_Date": "2024-03-01",
+                          "Capture_Time": "09:15:00", "Image_File": "ab/photo.jpg"})
+    uploads = tmp_path / "uploads"
+    (uploads / "ab").mkdir(parents=True)
+    (uploads / "ab" / "photo.jpg").write_bytes(b"original photo")
+    path = exports.create_backup(db, str(uploads), str(tmp_path / "admin.json"), str(tmp_path / "backups"),
+                                 manifest_path=str(tmp_path / "backup_manifest.json"),
+                                 archive_dir=str(tmp_path / "archive"))
+    return db, path
+
+def restore(db, path, tmp_path):
+    target = tmp_path / "restore"
+    return exports.import_backup(db, path, str(target / "uploads"), str(target / "admin.json"),
+                                 archive_dir=str(target / "archive"))
+
+def test_import_rejects_a_member_that_fails_its_checksum(backup, tmp_path):
+    db, path = backup
+    db.append_attendance({"Group": "G1", "Name": "Ravi", "Roll_No": "R2",
+                          "Capture_Date": "2024-03-02", "Capture_Time": "09:00:00"})
+    corrupt = tampered_copy(path, tmp_path / "corrupt.zip",
+                            lambda name, data: b"bit rot" if name == "uploads/ab/photo.jpg" else data)
+
+    with pytest.raises(ValueError, match="checksum"):
+        restore(db, corrupt, tmp_path)
+    assert len(db.load_attendance()) == 2
+    assert not [p for p in (tmp_path / "restore").rglob("*") if p.is_file()]
+
+    assert restore(db, path, tmp_path)["attendance"] == 1
+    assert (tmp_path / "restore" / "uploads" / "ab" / "photo.jpg").read_bytes() == b"original photo"
+
+def test_import_rejects_a_backup_missing_a_listed_file(backup, tmp_path):
+    db, path = backup
+    incomplete = tampered_copy(path, tmp_path / "incomplete.zip",
+                               lambda name, data: None if name == "uploads/ab/photo.jpg" else data)
+
+    with pytest.raises(ValueError, match="uploads/ab/photo.jpg"):
+        restore(db, incomplete, tmp_path)
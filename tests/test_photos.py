@@ -0,0 +1,25 @@
+from datetime import date
+
+import archive
+import photos
+import storage
+
+
+def test_migration_remaps_archived_attendance(tmp_path):
+    db = storage.CsvBackend(str(tmp_path / "users.csv"), str(tmp_path / "attendance.csv"))
+    archive_dir = str(tmp_path / "archive")
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    for name, day in [("old.jpg", "2023-01-10"), ("new.jpg", "2024-03-01")]:
+        (uploads / name).write_bytes(name.encode())
+        db.append_attendance({"Group": "G1", "Name": "Asha", "Roll_No": "R1", "Capture_Date": day,
+                              "Capture_Time": "09:00:00", "Image_File": name})
+    assert archive.archive_attendance(db, date(2024, 1, 1), archive_dir) == 1
+    version = archive.version(archive_dir)
+
+    assert photos.migrate_flat_uploads(db, str(uploads), archive_dir) == 2
+
+    files = archive.attendance_history(db, archive_dir=archive_dir)["Image_File"].tolist()
+    assert len(files) == 2 and not {"old.jpg", "new.jpg"} & set(files)
+    assert sorted((uploads / f).read_bytes() for f in files) == [b"new.jpg", b"old.jpg"]
+    assert archive.version(archive_dir) != version
@@ -0,0 +1,50 @@
+import sqlite3
+from concurrent.futures import Future
+
+import geo
+import reports
+import storage
+
+
+def attendance(name, day, time="09:00:00"):
+    return {"Group": "G1", "Name": name, "Roll_No": name.upper(), "Capture_Date": day, "Capture_Time": time}
+
+
+def test_unparseable_capture_dates_stay_out_of_the_date_range(tmp_path):
+    db = storage.CsvBackend(str(tmp_path / "users.csv"), str(tmp_path / "attendance.csv"))
+    rollups = reports.Rollups(str(tmp_path / "rollups.sqlite"))
+    rollups.refresh(db)
+    rollups.record(db, attendance("asha", "2024-03-01"), "BASM4")
+    rollups.record(db, attendance("ravi", "0000-00-00", "00:00:00"), "BASM4")
+    rollups.record(db, attendance("meera", "2024-03-05"), "BASM4")
+
+    assert rollups.date_range() == ("2024-03-01", "2024-03-05")
+    incremental = rollups.totals("2024-03-01", "2024-03-05")
+    rollups.rebuild(db)
+    assert rollups.date_range() == ("2024-03-01", "2024-03-05")
+    assert rollups.totals("2024-03-01", "2024-03-05") == incremental == (2, 2)
+
+
+def test_date_range_ignores_invalid_days_left_by_older_rollups(tmp_path):
+    path = str(tmp_path / "rollups.sqlite")
+    rollups = reports.Rollups(path)
+    with sqlite3.connect(path) as con:
+        con.executemany("INSERT INTO daily_counts VALUES (?, 'G1', 'BASM4', 1)",
+                        [("0000-00-00",), ("2024-13-40",), ("2024-03-02",)])
+    assert rollups.date_range() == ("2024-03-02", "2024-03-02")
+
+
+def test_late_location_lookup_is_written_back_without_staling_rollups(tmp_path):
+    db = storage.CsvBackend(str(tmp_path / "users.csv"), str(tmp_path / "attendance.csv"))
+    rollups = reports.Rollups(str(tmp_path / "rollups.sqlite"))
+    rollups.refresh(db)
+    lookup = Future()
+    row = dict(attendance("asha", "2024-03-01"), Photo_Location="Unknown", Upload_Location="Office")
+    record_id = rollups.record(db, row, "BASM4")
+
+    geo.backfill({"photo": lookup, "upload": None}, ["photo"], lambda values: rollups.update(db, record_id, values))
+    lookup.set_result("Ahmedabad")
+
+    saved = db.load_attendance().set_index("Record_Id").loc[record_id]
+    assert (saved["Photo_Location"], saved["Upload_Location"]) == ("Ahmedabad", "Office")
+    assert rollups._version() == repr(rollups._source_version(db))
@@ -0,0 +1,54 @@
+import pytest
+
+import roster
+import storage
+
+
+def user(i):
+    return {"Name": f"Intern {i}", "Roll_No": f"R{i}", "Organisation": "BASM4", "Group": "G1"}
+
+def record(i):
+    return {"Group": "G1", "Name": f"Intern {i}", "Roll_No": f"R{i}",
+            "Capture_Date": "2024-03-01", "Capture_Time": "09:00:00"}
+
+
+def test_sqlite_submit_keeps_users_version_and_indexes(tmp_path, monkeypatch):
+    db = storage.SqliteBackend(str(tmp_path / "attendance.sqlite"))
+    db.append_users([user(i) for i in range(3)])
+    users_version = db.version("users")
+    attendance_version = db.version("attendance")
+    index = roster.roster_index(db)
+
+    db.append_attendance(record(1))
+
+    assert db.version("users") == users_version
+    assert db.version("attendance") != attendance_version
+    monkeypatch.setattr(db, "load_users", lambda: (_ for _ in ()).throw(AssertionError("users re-read")))
+    assert roster.roster_index(db) is index
+
+def test_sqlite_versions_follow_writes_from_other_connections(tmp_path):
+    path = str(tmp_path / "attendance.sqlite")
+    db, other = storage.SqliteBackend(path), storage.SqliteBackend(path)
+    db.append_users([user(1)])
+    assert len(db.load_users()) == 1
+
+    before = db.version("users")
+    other.rename_group("G1", "G2")
+    assert db.version("users") != before
+    assert db.load_users()["Group"].tolist() == ["G2"]
+
+    other.delete_matching(group="G1")
+    other.append_attendance(record(1))
+    assert len(db.load_attendance()) == 1
+
+@pytest.mark.parametrize("kind", ["csv", "sqlite"])
+def test_bulk_time_update_after_date_column_removed(tmp_path, kind):
+    if kind == "csv":
+        db = storage.CsvBackend(str(tmp_path / "users.csv"), str(tmp_path / "attendance.csv"))
+    else:
+        db = storage.SqliteBackend(str(tmp_path / "attendance.sqlite"))
+    db.append_attendance(record(1))
+    db.drop_attendance_column("Capture_Date")
+
+    assert db.update_matching({"Capture_Time": "10:00:00"}) == 1
+    assert db.load_attendance()["Capture_Time"].tolist() == ["10:00:00"]